@@ -10,12 +10,148 @@ from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
 from pdfminer.pdfdevice import PDFDevice, TagExtractor
+from pdfminer.pdffont import PDFUnicodeNotDefined
 from pdfminer.pdfpage import PDFPage
 from pdfminer.converter import XMLConverter, HTMLConverter, TextConverter
 from pdfminer.cmapdb import CMapDB
 from pdfminer.layout import LAParams
 from pdfminer.image import ImageWriter
 
+EXTENSIONS = {'html' : 'htm', 'tag' : 'tag', 'text' : 'txt', 'xml' : 'xml'}
+
+class PageTextExtractor(PDFDevice):
+    """Collect the page texts the tag format would contain, without writing any markup.
+
+    After each page, `elements` holds the non-empty texts of its P tags, the
+    way an HTML parser reads them back from the tag file (a P tag closes the P
+    before it), and `text` holds all the text of the page.
+    """
+
+    def __init__(self, rsrcmgr):
+        PDFDevice.__init__(self, rsrcmgr)
+        self.pageno = 0
+        self.elements = []
+        self.text = []
+        self._current = None
+        self._stack = []
+        return
+
+    def render_string(self, textstate, seq):
+        font = textstate.font
+        text = u''
+        for obj in seq:
+            if not isinstance(obj, str):
+                continue
+            for cid in font.decode(obj):
+                try:
+                    text += font.to_unichr(cid)
+                except PDFUnicodeNotDefined:
+                    pass
+        self.text.append(text)
+        if self._current is not None:
+            self._current.append(text)
+        return
+
+    def _close(self):
+        if self._current is not None:
+            self.elements.append(u''.join(self._current))
+            self._current = None
+        return
+
+    def begin_page(self, page, ctm):
+        self.elements = []
+        self.text = []
+        self._current = None
+        return
+
+    def end_page(self, page):
+        self._close()
+        self.elements = [x for x in self.elements if x]
+        self.text = u''.join(self.text)
+        self.pageno += 1
+        return
+
+    def begin_tag(self, tag, props=None):
+        if tag.name.upper() == 'P':
+            self._close()
+            self._current = []
+        self._stack.append(tag)
+        return
+
+    def end_tag(self):
+        assert self._stack
+        tag = self._stack.pop(-1)
+        if tag.name.upper() == 'P':
+            self._close()
+        return
+
+def iter_page_texts(pdf, rsrcmgr=None, password='', caching=True):
+    """Yield (pageno, elements, text) of each page of a PDF file, one page at a time.
+
+    See PageTextExtractor for elements and text.
+    """
+    if rsrcmgr is None:
+        rsrcmgr = PDFResourceManager(caching=caching)
+    device = PageTextExtractor(rsrcmgr)
+    fp = file(pdf, 'rb')
+    try:
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for page in PDFPage.get_pages(fp, set(), password=password,
+                                      caching=caching, check_extractable=True):
+            interpreter.process_page(page)
+            yield device.pageno - 1, device.elements, device.text
+    finally:
+        fp.close()
+        device.close()
+
+# convert
+def convert(pdf, outfile=None, outtype='tag', rsrcmgr=None, codec='utf-8', laparams=None,
+            imagewriter=None, scale=1, layoutmode='normal', rotation=0, pagenos=None,
+            maxpages=0, password='', caching=True):
+    """Convert one PDF file in-process and return the output path.
+
+    outfile defaults to the PDF path with the extension of outtype.
+    CMaps loaded by pdfminer are cached for the whole process, so converting a
+    batch of files in one process only pays for them once. A fresh resource
+    manager is created per file unless one is given: its font cache is keyed by
+    object ids, which are only unique within one document.
+    """
+    if outtype not in EXTENSIONS:
+        raise ValueError('unknown output type: %s' % outtype)
+    if outfile is None:
+        outfile = pdf[0:-4] + '.' + EXTENSIONS[outtype]
+    if rsrcmgr is None:
+        rsrcmgr = PDFResourceManager(caching=caching)
+    outfp = file(outfile, 'wb')
+    try:
+        if outtype == 'text':
+            device = TextConverter(rsrcmgr, outfp, codec=codec, laparams=laparams,
+                                   imagewriter=imagewriter)
+        elif outtype == 'xml':
+            device = XMLConverter(rsrcmgr, outfp, codec=codec, laparams=laparams,
+                                  imagewriter=imagewriter)
+        elif outtype == 'html':
+            device = HTMLConverter(rsrcmgr, outfp, codec=codec, scale=scale,
+                                   layoutmode=layoutmode, laparams=laparams,
+                                   imagewriter=imagewriter)
+        else:
+            device = TagExtractor(rsrcmgr, outfp, codec=codec)
+        device.showpageno = False
+        fp = file(pdf, 'rb')
+        try:
+            interpreter = PDFPageInterpreter(rsrcmgr, device)
+            for page in PDFPage.get_pages(fp, pagenos or set(),
+                                          maxpages=maxpages, password=password,
+                                          caching=caching, check_extractable=True):
+                page.rotate = (page.rotate+rotation) % 360
+                interpreter.process_page(page)
+        finally:
+            fp.close()
+        device.close()
+    finally:
+        outfp.close()
+    return outfile
+
 # main
 def main(argv):
     import getopt
@@ -93,46 +229,19 @@ def main(argv):
     else:
         outfp = sys.stdout
 
+    if outtype not in EXTENSIONS:
+        return usage()
     for fname in args:
         l = glob.glob(fname)
         count = len(l)
         print 'Converting ' + str(count) + ' from ' + fname + ' to ' + outtype + ' format'
         for pdf in l:
-#             print pdf
-            d = {'html' : 'htm', 'tag' : 'tag', 'text' : 'txt', 'xml' : 'xml'}
-            ext = '.' + d[outtype]
-            outfile = pdf[0:-4] + ext
+            outfile = pdf[0:-4] + '.' + EXTENSIONS[outtype]
             print outfile
-            outfp = file(outfile, 'wb')
-            if outtype == 'text':
-                device = TextConverter(rsrcmgr, outfp, codec=codec, laparams=laparams,
-                                       imagewriter=imagewriter)
-                device.showpageno = False
-            elif outtype == 'xml':
-                device = XMLConverter(rsrcmgr, outfp, codec=codec, laparams=laparams,
-                                      imagewriter=imagewriter)
-                device.showpageno = False
-            elif outtype == 'html':
-                device = HTMLConverter(rsrcmgr, outfp, codec=codec, scale=scale,
-                                       layoutmode=layoutmode, laparams=laparams,
-                                       imagewriter=imagewriter)
-                device.showpageno = False
-            elif outtype == 'tag':
-                device = TagExtractor(rsrcmgr, outfp, codec=codec)
-                device.showpageno = False
-            else:
-                return usage()
-    
-            fp = file(pdf, 'rb')
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            for page in PDFPage.get_pages(fp, pagenos,
-                                          maxpages=maxpages, password=password,
-                                          caching=caching, check_extractable=True):
-                page.rotate = (page.rotate+rotation) % 360
-                interpreter.process_page(page)
-            fp.close()
-            device.close()
-            outfp.close()
+            convert(pdf, outfile, outtype, rsrcmgr, codec=codec, laparams=laparams,
+                    imagewriter=imagewriter, scale=scale, layoutmode=layoutmode,
+                    rotation=rotation, pagenos=pagenos, maxpages=maxpages,
+                    password=password, caching=caching)
 
         print 'Done'
     return
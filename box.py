@@ -19,30 +19,124 @@ optional arguments:
         The file should be a tab-delimited file. See raw\\drop.csv for a real example.
     --level LEVEL 
         Logging level of python built-in logging module.
+    --incremental
+        Reuse parsed lines of earlier runs (kept in parsed.pkl of the archive) and only parse markup files which are new or changed.
+    --no-cache, --rebuild-cache
+        Parsed lines of every markup file are cached in cache/ of the archive, keyed by the file content and its layout (see layouts.json).
+        Use --no-cache to bypass the cache, or --rebuild-cache to parse all files again and refresh it.
+    -j N, --jobs N
+        Convert PDF files and parse markup files with N worker processes. Result is identical to serial parsing.
+    --rate RATE, --download-workers N
+        Download PDF files with N concurrent workers sharing one keep-alive session, sending at most RATE requests per second.
+        Interrupted downloads are resumed, and files unchanged on the server (by ETag/Last-Modified) are not fetched again.
+    --engine {tag,pdf}, --keep-tag
+        'tag' (default) converts PDF files to markup files and parses them. 'pdf' extracts the lines straight from the
+        PDF files with pdfminer, skipping the markup files; add --keep-tag to still write them for debugging.
+    --no-xlsx
+        Skip the slow xlsx writers.
+    --columnar {parquet,feather}
+        Also write box_hist and box in this typed columnar format (requires pyarrow): dates as datetime64,
+        page numbers and counts as int64 with -1 for NULL.
+    --report PATH
+        Path of the json run report (default box_report.json): wall time, cpu time, peak memory and row counts
+        of every stage (crawl, convert, parse, ..., writers) and of every converted or parsed file. Peak memory is
+        the peak of the process (the worker process with -j) so far at the end of the stage or file, not its own peak.
+    --profile PATH
+        Dump cProfile stats of the whole run to PATH, e.g. for `python -m pstats PATH`.
+    --offline
+        Process the bulletins recorded in manifest.json of the archive without sending any request.
+        The manifest keeps id, title, url, sha1, download time and parse status of every bulletin, and the
+        validators of the listing pages, so that an unchanged listing is answered by a 304 and not parsed again.
+        A manifest indexed from the pdf files of an older archive has no title of weekly bulletins, which gives their
+        period: run once without --offline to fetch them.
+    --backfill
+        Listing pages are walked (--download-workers pages at a time) only down to the first page listing a bulletin
+        already downloaded. Use --backfill to walk every page, e.g. to fill gaps of the archive.
+    --rebuild
+        Only the parts of box_hist.csv and box.csv changed since the last run (bulletins of the history file, films of
+        the ranking file, from the first changed one on) are written again, and the other output files only when their
+        table differs from the one they were last written from (also after runs with --no-xlsx or without --columnar);
+        the files are the same as a full rewrite. Use --rebuild to rewrite every output file.
+    --watch [MINUTES], --status PATH
+        Keep running: process once, then poll the first page of the listings every MINUTES (default 30) and process
+        again, incrementally, whenever new bulletins are listed. Parsed lines, layouts and the http session stay in
+        memory. A failed run is run again at every poll until it succeeds. The status file (default box_status.json)
+        keeps the state, last poll, last run timing and last error.
+    --check
+        Only print the ids listed in the first page of the listings which are not in the local archive, and exit with
+        status 1 if there is none, e.g. 'python box.py --check && python box.py'. Pandas and the parsing stack are not
+        loaded: heavy modules of box.py are only imported by the stages using them.
+    --storage {fs,sqlite}, --archive PATH, --pack DB
+        Where the archive (pdf and markup files, manifest, parsing cache, parsed lines) is kept: 'fs' (default) as files
+        under raw\\, 'sqlite' as documents of one SQLite file (default raw.sqlite); --archive gives the directory or file.
+        Use --pack DB to copy the archive into SQLite file DB and exit. From python, set_storage(MemoryStorage()) keeps
+        the archive in memory, e.g. for tests.
           
 Output: 
     - box.xlsx: parsed data. xlsx foramt.
     - box.csv: parsed data. tab-delimited file, utf8 without BOM.
+    - box.parquet / box.feather, box_hist.parquet / box_hist.feather: typed data, with --columnar.
     - flat.csv: intermediate parsing result, for debugging use.
+    - box_output.json: blocks of box_hist.csv and box.csv written by the last run, and digests of the tables of the
+      other output files, see --rebuild.
+    - box_report.json: timing and memory of every stage of the run, and the validation report: lines of every page and
+      file against the lines expected in them, lines failing sanity checks (e.g. decreasing totals of a film), and
+      malformed values as found in the bulletins or the append file.
 
 Example Usage:
     python box.py -l 1
     python box.py -s -a raw/append.csv -d raw/drop.csv --level DEBUG
+    python box.py --watch 60 -a raw/append.csv -d raw/drop.csv
+
+Layouts:
+    Column templates of the bulletins, by range of file id, and the ad-hoc fixes of single files are kept in layouts.json.
+    Add a template or an override there when TFI changes the layout of its bulletins.
+
+Streaming API:
+    iter_rows(item_info) yields the parsed lines of every file, file by file, and iter_chunks(rows) turns them into
+    typed data frames of CHUNK_ROWS lines, so that other tools can write parsed lines into their own sinks batch by batch.
     
 @author: kimballXD@gmail.com
 """
 import os
+import sys
 import re
+import hashlib
 import datetime
-import subprocess as sp
-import shutil
+import importlib
+import json
 import logging
-import glob
-import requests
-from bs4 import BeautifulSoup as bs
-import pandas as pd
-import datetime
+import contextlib
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import time
+import io
+import shutil
+import tempfile
+import cPickle as pickle
+
+class _LazyModule(object):
+    """
+    module imported on its first use, so that light entry points (e.g. --check) do not pay for the heavy ones
+        pd=_LazyModule('pandas')
+    """
+    def __init__(self, name):
+        self._name=name
+        self._module=None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module=importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+sp=_LazyModule('subprocess')
+requests=_LazyModule('requests')
+bs4=_LazyModule('bs4')
+etree=_LazyModule('lxml.etree')
+sqlite3=_LazyModule('sqlite3')
+np=_LazyModule('numpy')
+pd=_LazyModule('pandas')
 
 #%% ==constant and utitlities
 
@@ -86,11 +180,75 @@ MONTH_DATA=[('26.pdf','2016-12-06','2017-01-05'),
             ('39.pdf','2017-10-06','2017-11-05')]
 
 NUMBER_OF_LOGICAL_COLUMNS=13 # see docstring of _file_type
+
+SUP_KEYS=['fileName','pageNum','lineIdx'] # key of lines in append and drop files
+
+# schema of parsed lines, applied when the data frame is built, see _apply_schema
+PARSE_COLUMNS=['fileName', 'pageNum', 'lineIdx', 'country', 'name', 'pubDate', 'publisher','production','pub_days',
+               'cur_theaters', 'max_theaters', 'cur_tickets','cur_sales', 'total_tickets', 'total_sales']
+CATEGORY_COLUMNS=['fileName','country','publisher','production'] # few distinct values repeated on every line
+COUNT_DTYPES={'pub_days':'int32', 'cur_theaters':'int32', 'max_theaters':'int32', 'cur_tickets':'int32',
+              'cur_sales':'int64', 'total_tickets':'int32', 'total_sales':'int64'}
+CHUNK_ROWS=20000 # parsed lines are turned into typed data frames in chunks of this size, see iter_chunks
+COUNT_COLUMNS=['pub_days','cur_theaters','max_theaters','cur_tickets','cur_sales','total_tickets','total_sales']
+
+DATE_PATTERN=re.compile('\d{4}/\d{2}/\d{2}') # every parsed line has one pubDate
+
+ARCHIVE_ROOT='raw' # directory of the file system storage, see FileStorage
+ARCHIVE_DB='raw.sqlite' # database of the SQLite storage, see SqliteStorage
+
+# names of documents in the storage, see set_storage
+PARSED_NAME='parsed.pkl' # parsed lines kept between incremental runs
+
+MANIFEST_NAME='manifest.json' # crawled bulletins and listing pages, see _load_manifest
+
+CACHE_PREFIX='cache/' # parsed lines of every markup file, keyed by file content and layout, see _cache_name
+CACHE_VERSION=2 # bump when the parsing logic changes its output
+
+REPORT_PATH='box_report.json' # run report: timing, memory and row counts of every stage and file
+OUTPUT_STATE_PATH='box_output.json' # blocks of the csv outputs written by the last run, see _write_csv
+
+TFI_URL='https://www.tfi.org.tw'
+LISTING_PAGE='{}?p={}' # page n of a listing page, linked from the pagination of the first page
+LISTINGS=['weekly','monthly'] # listing pages of bulletins, see _listing_urls
+STATUS_PATH='box_status.json' # status of the watch mode, see watch
+WATCH_INTERVAL=30 # minutes between two polls of the listings in watch mode
+USER_AGENT='Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/66.0.3359.181 Safari/537.36'
+DOWNLOAD_RATE=1.0 # requests per second sent to TFI, shared by all download workers
+DOWNLOAD_WORKERS=4
+
+PDF2TAG_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin', 'pdf2tag')
+
+LAYOUTS_PATH=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts.json') # layout registry, see _load_layouts
+ROW_NUMBER=-2 # plan of a missing column: impute row numbers, see _get_layout
+NULL_VALUE=-1 # plan of a missing column: -1 (NULL)
   
   
+_LAYOUT_REGISTRY=None # (templates, overrides) of layouts.json, see _load_layouts
+_LAYOUTS={} # fileName -> compiled layout, see _get_layout
+
+def _load_layouts(path=LAYOUTS_PATH):
+    """
+    read the layout registry once per process
+    templates: column templates, by range of file id ('ids': [first, last], null for open end)
+    overrides: ad-hoc fixes of single files, by file id:
+        drop_annotation: drop annotation line of the last page
+        impute_cols: insert cells lost in the pdf file, by page
+        no_header: running headers of the first page only
+        skip: failed parsing (using append file)
+    """
+    global _LAYOUT_REGISTRY
+    if _LAYOUT_REGISTRY is None:
+        with open(path) as infile:
+            registry=json.load(infile)
+        if registry['columns']!=PARSE_COLUMNS[2:]:
+            raise ValueError('columns of {} differ from the logical columns of box.py'.format(path))
+        _LAYOUT_REGISTRY=(registry['templates'], registry['overrides'])
+    return _LAYOUT_REGISTRY
+
 def _file_type(fileName):
     """
-    hard-code column info of pdf file
+    column info of pdf file, from the layout registry (see _load_layouts)
     compatible column templates:
         0  lineIdx
         1  country
@@ -106,96 +264,765 @@ def _file_type(fileName):
         11 total_tickets
         12 total_sales
     """
-    
+    templates, overrides=_load_layouts()
     file_id=int(fileName.split('.')[0])
-    if file_id <40:
-        res= {'ncols':10,   # 9 col + row_idx
-              'strt_idx':9,
-              'missing_cols':(7,9,10),}
-               
-    elif file_id>=40 and file_id<49:
-        res= {'ncols':10,  # 10 col
-                'strt_idx':10,
-                'missing_cols':(0,6,8),}
-
-    elif file_id>=49:
-        res= {'ncols':11,  # 10 col + row_idx
-                'strt_idx':11,
-                'missing_cols':(6,8)}
-    
-    # ad-hoc fix: annotaion lines
-    if file_id in [31,35]:
-        res['drop_annotation']=True
-        
-    # ad-hoc fix: missing columns
-    if file_id in [47]:
-        res['impute_cols']=[{'page_idx':3,'insert':[(80,'')]}]
-    elif file_id in [35]:
-        res['impute_cols']=[{'page_idx':18,'insert':[(89,'131')]}]
-
-    # ad-hoc fix: missing running headers    
-    if file_id in [70,71,72,76,77,78,79,80,82,84]:
-        res['no_header']=True
-    
-    # ad-hoc fix: failed parsing (using append file)
-    if file_id in [81,83]:
-        res['skip']=True
-          
+    res=None
+    for template in templates:
+        first, last=template['ids']
+        if (first is None or file_id>=first) and (last is None or file_id<=last):
+            res=dict(template)
+            break
+    if res is None:
+        raise ValueError('no layout of {} in {}'.format(fileName, LAYOUTS_PATH))
+    res.update(overrides.get(str(file_id), {}))
+    for x in ['ids', 'note']:
+        res.pop(x, None)
+    res['missing_cols']=tuple(res['missing_cols'])
+    if 'impute_cols' in res:
+        res['impute_cols']=[{'page_idx':x['page_idx'], 'insert':[tuple(y) for y in x['insert']]} for x in res['impute_cols']]
     return res
+
+def _get_layout(fileName):
+    """
+    _file_type of fileName compiled into a column-mapping plan, once per process
+        sources: for every logical column, index of the cell in the line, or ROW_NUMBER or NULL_VALUE
+        impute: page_idx -> list of (insert_idx, cell)
+        strt_idx, strt_idx_rest: index of the first cell of the first page, and of the other pages
+    """
+    if fileName not in _LAYOUTS:
+        attr=_file_type(fileName)
+        sources=[]
+        skip=0
+        for i in range(NUMBER_OF_LOGICAL_COLUMNS):
+            if i in attr['missing_cols']:
+                # missing row number: automatic impute row numbers
+                sources.append(ROW_NUMBER if i==0 else NULL_VALUE)
+                skip+=1
+            else:
+                sources.append(i-skip)
+        impute={}
+        for x in attr.get('impute_cols', []):
+            impute.setdefault(x['page_idx'], []).extend(x['insert'])
+        _LAYOUTS[fileName]={'skip':attr.get('skip', False),
+                            'drop_annotation':attr.get('drop_annotation', False),
+                            'impute':impute,
+                            'ncols':attr['ncols'],
+                            'strt_idx':attr['strt_idx'],
+                            'strt_idx_rest':0 if attr.get('no_header') else attr['strt_idx'],
+                            'sources':sources}
+    return _LAYOUTS[fileName]
         
-def _see_flat_page(path, page, prnt=True):
+def _iter_pages(name):
+    """
+    stream pages of markup file name of the storage, only one page is kept in memory at a time
+    yield (pageNum, elements, count, is_last):
+        elements: texts of non-empty <p> of the page
+        count: number of dates in the page, i.e. number of lines expected
+        is_last: whether it is the last page of the file
+    """
+    def pages():
+        with _get_storage().open(name) as infile:
+            for event, page in etree.iterparse(infile, events=('end',), tag='page', html=True, encoding='utf-8'):
+                elements=[x for x in (u''.join(y.itertext()) for y in page.iter('p')) if x]
+                count=len(DATE_PATTERN.findall(u''.join(page.itertext())))
+                yield page.get('id'), elements, count
+                # release parsed pages
+                page.clear()
+                while page.getprevious() is not None:
+                    del page.getparent()[0]
+    return _mark_last(pages())
+
+def _iter_pdf_pages(name):
+    """same as _iter_pages, but read straight from the pdf file with pdfminer, without markup file"""
+    pdf2tag=_import_pdf2tag()
+    if pdf2tag is None:
+        raise ImportError('pdfminer is required to parse pdf files directly')
+    def pages():
+        with _get_storage().local_file(name) as path:
+            for pageno, elements, text in pdf2tag.iter_page_texts(path):
+                yield str(pageno), elements, len(DATE_PATTERN.findall(text))
+    return _mark_last(pages())
+
+def _mark_last(pages):
+    # look one page ahead to flag the last page
+    last=None
+    for page in pages:
+        if last is not None:
+            yield last+(False,)
+        last=page
+    if last is not None:
+        yield last+(True,)
+
+def _see_flat_page(name, page, prnt=True):
     """debuging utilities"""
-    with open(path,'rb') as infile:
-        soup=bs(infile,'lxml')
-    pages=soup.select('page')
-    for x in pages:
-        if x.get('id')!=str(page):
+    for pageNum, elements, count, is_last in _iter_pages(name):
+        if pageNum!=str(page):
             continue
         else:
-            elements=[y.text for y in x.select('p') if y.text]
             if prnt:
                 for idx, y in enumerate(elements):
                     print idx, y
             return elements
 
-def _count_lines(path):
-    with open(path,'rb') as infile:
-        soup=bs(infile,'lxml')
-    texts=soup.text
-    return len(re.findall('\d{4}/\d{2}/\d{2}',texts))
+def _count_lines(name):
+    """debuging utilities, see _check_pages for the counts kept while parsing"""
+    return sum(count for pageNum, elements, count, is_last in _iter_pages(name))
 
               
+def _cpu_time():
+    """cpu time of this process and its finished worker processes"""
+    times=os.times()
+    return sum(times[:4])
+
+def _peak_rss():
+    """peak resident memory of this process in bytes, None when unavailable (Windows without psutil)"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info=psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform=='darwin' else peak*1024
+
+def _replace(source, path):
+    """move file source into place at path, so that readers never see a half-written file"""
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(source, path)
+
+def _write_file(path, content):
+    """write content aside and move it into place, see _replace"""
+    with open(path+'.tmp','wb') as out:
+        out.write(content)
+    _replace(path+'.tmp', path)
+
+def _save_json(obj, path):
+    _write_file(path, json.dumps(obj, indent=2, sort_keys=True))
+
+def _timed_call(func, *args):
+    """return (result, wall time, cpu time, peak memory) of func(*args), see _peak_rss"""
+    wall, cpu=time.time(), _cpu_time()
+    res=func(*args)
+    return res, time.time()-wall, _cpu_time()-cpu, _peak_rss()
+
+class _RunReport(object):
+    """
+    timing, memory and row counts of every stage and input file of a run, dumped as json next to the outputs
+        with report.stage('parse') as stage:
+            data=...
+            stage['rows']=len(data)
+    peak_rss of a stage or file is the peak memory of the process (the worker process for files parsed or converted
+    with jobs) up to its end, see _peak_rss, not the memory used by the stage or file alone
+    """
+    def __init__(self):
+        self.start=datetime.datetime.now()
+        self.wall=time.time()
+        self.stages=[]
+        self.files=[]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record={'stage':name, 'rows':None}
+        wall, cpu=time.time(), _cpu_time()
+        try:
+            yield record
+        finally:
+            record['wall']=time.time()-wall
+            record['cpu']=_cpu_time()-cpu
+            record['peak_rss']=_peak_rss()
+            self.stages.append(record)
+            logging.debug('stage {} took {:.3f}s'.format(name, record['wall']))
+
+    def add_file(self, stage, fileName, wall, cpu, peak_rss, **kwargs):
+        kwargs.update({'stage':stage, 'fileName':fileName, 'wall':wall, 'cpu':cpu, 'peak_rss':peak_rss})
+        self.files.append(kwargs)
+
+    def dump(self, path=REPORT_PATH, **kwargs):
+        report={'start':self.start.isoformat(), 'wall':time.time()-self.wall, 'cpu':_cpu_time(),
+                'peak_rss':_peak_rss(), 'stages':self.stages, 'files':self.files}
+        report.update(kwargs)
+        _save_json(report, path)
+
+#%% == storage ==
+
+class _Storage(object):
+    """
+    documents of the archive by name, e.g. 26.pdf, 26.tag, manifest.json, cache/26.pdf.pkl
+    subclasses implement exists, signature, get, put, remove, rename and list
+    shared: whether worker processes see and keep what they read and write
+    """
+    shared=True
+
+    def open(self, name, mode='rb'):
+        """file object of name, mode: 'rb', 'wb' or 'ab'; written documents are stored on close"""
+        if mode=='rb':
+            return io.BytesIO(self.get(name))
+        return _DocumentWriter(self, name, self.get(name) if mode=='ab' and self.exists(name) else '')
+
+    @contextlib.contextmanager
+    def local_file(self, name):
+        """path of a local copy of name, for tools which only read files, e.g. pdfminer"""
+        root=tempfile.mkdtemp(prefix='box')
+        try:
+            path=os.path.join(root, name.split('/')[-1])
+            with open(path,'wb') as out:
+                out.write(self.get(name))
+            yield path
+        finally:
+            shutil.rmtree(root, True)
+
+    def put_file(self, name, path):
+        """store local file path as name"""
+        with open(path,'rb') as infile:
+            self.put(name, infile.read())
+
+class _DocumentWriter(io.BytesIO):
+    """file object of a document being written, see _Storage.open"""
+    def __init__(self, storage, name, content=''):
+        io.BytesIO.__init__(self)
+        self.write(content)
+        self.storage, self.name=storage, name
+
+    def close(self):
+        if not self.closed:
+            self.storage.put(self.name, self.getvalue())
+        io.BytesIO.close(self)
+
+class FileStorage(_Storage):
+    """documents as files under root, e.g. raw\\26.pdf"""
+    def __init__(self, root=ARCHIVE_ROOT):
+        self.root=root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def _makedirs(self, path):
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by another worker process meanwhile
+                pass
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def signature(self, name):
+        """(size, modification time) of name"""
+        stat=os.stat(self._path(name))
+        return (stat.st_size, stat.st_mtime)
+
+    def get(self, name):
+        with open(self._path(name),'rb') as infile:
+            return infile.read()
+
+    def put(self, name, content):
+        path=self._path(name)
+        self._makedirs(path)
+        _write_file(path, content)
+
+    def open(self, name, mode='rb'):
+        path=self._path(name)
+        if mode!='rb':
+            self._makedirs(path)
+        return open(path, mode)
+
+    def remove(self, name):
+        os.remove(self._path(name))
+
+    def rename(self, name, new_name):
+        _replace(self._path(name), self._path(new_name))
+
+    def list(self, prefix=''):
+        """names starting with prefix, only the folder of prefix (e.g. cache/ for 'cache/26') is read"""
+        folder=prefix.rpartition('/')[0]
+        names=[]
+        for root, dirs, files in os.walk(self._path(folder) if folder else self.root):
+            folder=os.path.relpath(root, self.root).replace(os.sep, '/')
+            names.extend(x if folder=='.' else '{}/{}'.format(folder, x) for x in files if not x.endswith('.tmp'))
+        return sorted(x for x in names if x.startswith(prefix))
+
+    @contextlib.contextmanager
+    def local_file(self, name):
+        yield self._path(name)
+
+    def put_file(self, name, path):
+        if os.path.abspath(path)!=os.path.abspath(self._path(name)):
+            _Storage.put_file(self, name, path)
+
+class SqliteStorage(_Storage):
+    """documents as blobs of one SQLite file, e.g. to read a packed archive in one go from network storage"""
+    def __init__(self, path=ARCHIVE_DB):
+        self.path=path
+        self.lock=threading.Lock()
+        self.con=None
+        self.pid=None
+
+    def __getstate__(self):
+        return {'path':self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _execute(self, sql, *args):
+        with self.lock:
+            # one connection per process, shared by the download threads
+            if self.con is None or self.pid!=os.getpid():
+                self.con=sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+                self.con.execute('CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, content BLOB, size INTEGER, mtime REAL)')
+                self.pid=os.getpid()
+            rows=self.con.execute(sql, args).fetchall()
+            self.con.commit()
+            return rows
+
+    def exists(self, name):
+        return bool(self._execute('SELECT 1 FROM documents WHERE name=?', name))
+
+    def signature(self, name):
+        rows=self._execute('SELECT size, mtime FROM documents WHERE name=?', name)
+        if not rows:
+            raise IOError('no document {} in {}'.format(name, self.path))
+        return tuple(rows[0])
+
+    def get(self, name):
+        rows=self._execute('SELECT content FROM documents WHERE name=?', name)
+        if not rows:
+            raise IOError('no document {} in {}'.format(name, self.path))
+        return str(rows[0][0])
+
+    def put(self, name, content):
+        self._execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)', name, sqlite3.Binary(content), len(content), time.time())
+
+    def remove(self, name):
+        self._execute('DELETE FROM documents WHERE name=?', name)
+
+    def rename(self, name, new_name):
+        self._execute('DELETE FROM documents WHERE name=?', new_name)
+        self._execute('UPDATE documents SET name=? WHERE name=?', new_name, name)
+
+    def list(self, prefix=''):
+        if not prefix:
+            return [x[0] for x in self._execute('SELECT name FROM documents ORDER BY name')]
+        # a range of names rather than a function of name, so that the primary key index is used
+        rows=self._execute('SELECT name FROM documents WHERE name>=? AND name<? ORDER BY name',
+                           prefix, prefix[:-1]+unichr(ord(prefix[-1])+1))
+        return [x[0] for x in rows]
+
+class MemoryStorage(_Storage):
+    """documents in a dict, e.g. to run the whole process in memory; worker processes only see copies of it"""
+    shared=False
+
+    def __init__(self):
+        self.documents={}
+
+    def exists(self, name):
+        return name in self.documents
+
+    def signature(self, name):
+        content, mtime=self.documents[name]
+        return (len(content), mtime)
+
+    def get(self, name):
+        if name not in self.documents:
+            raise IOError('no document {}'.format(name))
+        return self.documents[name][0]
+
+    def put(self, name, content):
+        self.documents[name]=(content, time.time())
+
+    def remove(self, name):
+        del self.documents[name]
+
+    def rename(self, name, new_name):
+        self.documents[new_name]=self.documents.pop(name)
+
+    def list(self, prefix=''):
+        return sorted(x for x in self.documents if x.startswith(prefix))
+
+_STORAGE=None
+
+def _get_storage():
+    """storage of the archive, FileStorage of ARCHIVE_ROOT unless set by set_storage"""
+    global _STORAGE
+    if _STORAGE is None:
+        _STORAGE=FileStorage()
+    return _STORAGE
+
+def set_storage(storage):
+    """
+    keep pdf files, markup files, parsed lines and the manifest in storage: FileStorage, SqliteStorage or MemoryStorage
+        >>> box.set_storage(box.MemoryStorage())
+    """
+    global _STORAGE
+    _STORAGE=storage
+
+def copy_storage(source, target):
+    """copy every document of storage source into storage target, e.g. to pack raw\\ into one SQLite file"""
+    for name in source.list():
+        target.put(name, source.get(name))
+
+def _pool(jobs, tasks):
+    """worker processes sharing the storage, None when one process is enough or the storage is not shared"""
+    storage=_get_storage()
+    if jobs>1 and len(tasks)>1 and storage.shared:
+        return multiprocessing.Pool(min(jobs, len(tasks)), set_storage, (storage,))
+    return None
+
 #%% == crawl and parsing ==
 
-def _get_pdf_file_name(fileId):
-    headers={'Referer':'https://www.tfi.org.tw/BoxOfficeBulletin/weekly',
-         'User-Agent':'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/66.0.3359.181 Safari/537.36',
-         }
-         
+class _RateLimiter(object):
+    """politeness: at most `rate` requests per second, shared by threads"""
+    def __init__(self, rate=DOWNLOAD_RATE):
+        self.interval=1.0/rate if rate else 0
+        self.lock=threading.Lock()
+        self.next_time=0
+
+    def wait(self):
+        with self.lock:
+            now=time.time()
+            delay=self.next_time-now
+            self.next_time=max(now, self.next_time)+self.interval
+        if delay>0:
+            time.sleep(delay)
+
+_SESSION=None
+
+def _get_session():
+    """shared keep-alive session"""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION=requests.Session()
+        _SESSION.headers['User-Agent']=USER_AGENT
+        _SESSION.verify=False
+        adapter=requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS*4)
+        _SESSION.mount('http://', adapter)
+        _SESSION.mount('https://', adapter)
+    return _SESSION
+
+def _get_pdf_file_name(fileId, base_url=TFI_URL, limiter=None):
+    headers={'Referer':'{}/BoxOfficeBulletin/weekly'.format(base_url)}
     data = {'id':fileId}
-    rep=requests.post('https://www.tfi.org.tw/BoxOfficeBulletin/Open/',
-                      headers=headers, data=data, verify=False)
+    if limiter:
+        limiter.wait()
+    rep=_get_session().post('{}/BoxOfficeBulletin/Open/'.format(base_url),
+                            headers=headers, data=data)
     return rep.json()['Url']
 
+def _download_pdf(uri, path, limiter=None):
+    """
+    download uri to document path of the storage
+        - a partial download (path.part) is resumed with a Range request
+        - a downloaded file is not fetched again when its ETag/Last-Modified (kept in path.meta) is unchanged
+    return False if the file is unchanged
+    """
+    storage=_get_storage()
+    part_path=path+'.part'
+    meta_path=path+'.meta'
+    meta={}
+    if storage.exists(meta_path):
+        meta=json.loads(storage.get(meta_path))
+
+    headers={}
+    offset=storage.signature(part_path)[0] if storage.exists(part_path) else 0
+    if offset:
+        headers['Range']='bytes={}-'.format(offset)
+        if meta.get('etag') or meta.get('last_modified'):
+            headers['If-Range']=meta.get('etag') or meta.get('last_modified')
+    elif storage.exists(path):
+        if meta.get('etag'):
+            headers['If-None-Match']=meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since']=meta['last_modified']
+
+    if limiter:
+        limiter.wait()
+    rep=_get_session().get(uri, headers=headers, stream=True)
+    if rep.status_code==304:
+        logging.debug('{} is not modified'.format(path))
+        return False
+    rep.raise_for_status()
+
+    # keep validators before writing body, so that an interrupted download can be resumed
+    meta={'etag':rep.headers.get('ETag'), 'last_modified':rep.headers.get('Last-Modified')}
+    storage.put(meta_path, json.dumps(meta))
+    with storage.open(part_path, 'ab' if rep.status_code==206 else 'wb') as out:
+        for chunk in rep.iter_content(64*1024):
+            out.write(chunk)
+    storage.rename(part_path, path)
+    return True
               
-def _preprocessing(latest_crawl=None):
-    # get full box office pdf (for the first page...this part needs to modify when paging mechanism kicks in....
-    ids=[]
-    data_list=[]
-    for index_url in ['https://www.tfi.org.tw/BoxOfficeBulletin/weekly','https://www.tfi.org.tw/BoxOfficeBulletin/monthly']:
-        page=requests.get(index_url, verify=False)
-        page.encoding='utf8'
-        pageSoup=bs(page.text, 'lxml')
-        datas=pageSoup.find_all(attrs={'data-id':True})
-        data_list.extend(datas)
-        ids.extend([x.get('data-id') for x in datas])
+def _import_pdf2tag():
+    """import bin/pdf2tag/pdf2tag.py, return None if pdfminer is not installed"""
+    if PDF2TAG_DIR not in sys.path:
+        sys.path.append(PDF2TAG_DIR)
+    try:
+        import pdf2tag
+    except ImportError:
+        return None
+    return pdf2tag
+
+def _tag_name(name):
+    """markup file of pdf file name"""
+    return name[:-4]+'.tag'
+
+def _convert_pdf(name):
+    """convert pdf file name of the storage to its markup file, see _tag_name"""
+    pdf2tag=_import_pdf2tag()
+    with _get_storage().local_file(name) as path:
+        if pdf2tag is None:
+            sp.check_call('"{}" "{}"'.format(os.path.join(PDF2TAG_DIR, 'pdf2tag.exe'), path), shell=True)
+        else:
+            pdf2tag.convert(path)
+        # the converter writes the markup file next to the pdf file
+        _get_storage().put_file(_tag_name(name), _tag_name(path))
+
+def _convert_pdf_job(name):
+    # module level function, so that it can be sent to worker processes
+    return _timed_call(_convert_pdf, name)
+
+def _convert_pdfs(paths, jobs=1, report=None):
+    """
+    convert pdf files of the storage to markup files in-process, which keeps the pdfminer CMap cache warm between files
+    falls back to one pdf2tag.exe call per file when pdfminer is not installed
+    """
+    pool=_pool(jobs, paths)
+    if pool:
+        try:
+            results=pool.map(_convert_pdf_job, paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results=[_convert_pdf_job(x) for x in paths]
+    if report:
+        for path, (_, wall, cpu, peak_rss) in zip(paths, results):
+            report.add_file('convert', path, wall, cpu, peak_rss)
+
+def _file_sha1(name):
+    sha1=hashlib.sha1()
+    with _get_storage().open(name) as infile:
+        for chunk in iter(lambda: infile.read(1024*1024), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _load_manifest(name=MANIFEST_NAME):
+    """
+    manifest of the local archive:
+        bulletins: dict of id -> fileName, title, url, sha1 (of pdf file), downloaded, parsed, lines, count, status
+        listings: dict of listing url -> etag, last_modified, items (list of [id, title]) of the last fetch
+    an archive crawled before the manifest existed is indexed from its pdf files once
+    """
+    storage=_get_storage()
+    if storage.exists(name):
+        return json.loads(storage.get(name))
+    manifest={'bulletins':{}, 'listings':{}}
+    for fileName in storage.list():
+        if fileName.endswith('.pdf'):
+            manifest['bulletins'][fileName.split('.')[0]]={'fileName':fileName, 'sha1':_file_sha1(fileName)}
+    return manifest
+
+def _save_manifest(manifest, name=MANIFEST_NAME):
+    _get_storage().put(name, json.dumps(manifest, indent=2, sort_keys=True))
+
+def _manifest_items(manifest):
+    """items of every downloaded bulletin in the manifest, as returned by _preprocessing"""
+    items=[(x, '{}.pdf'.format(x), '{}.pdf'.format(x), '{}.tag'.format(x), y.get('title'))
+           for x, y in manifest['bulletins'].items() if y.get('sha1')]
+    return sorted(items, key=lambda x:int(x[0]))
+
+def _record_parsed(manifest, item_info, parsed, data):
+    """keep parse status of every file in the manifest, see iter_rows for parsed, and data parsed from it"""
+    now=datetime.datetime.now().isoformat()
+    sizes=data.groupby('fileName', observed=True).size()
+    for uri, path, fileName, tag_file, title in item_info:
+        if fileName not in parsed:
+            continue
+        entry=manifest['bulletins'].setdefault(fileName.split('.')[0], {'fileName':fileName})
+        lines, count=int(sizes.get(fileName, 0)), _expected_lines(parsed[fileName][2])
+        entry.update({'parsed':now, 'lines':lines, 'count':count,
+                      'status':'skip' if 'skip' in _file_type(fileName) else 'ok' if lines==count else 'inconsistent'})
+
+def _preprocessing(latest_crawl=None, base_url=TFI_URL, workers=DOWNLOAD_WORKERS, rate=DOWNLOAD_RATE, jobs=1,
+                   convert=True, report=None, manifest=None, offline=False, backfill=False):
+    """
+    return item_info: (uri, pdf file, fileName, markup file, title) of every bulletin, files are names in the storage
+    convert: whether to convert crawled pdf files to markup files
+    report: _RunReport recording the crawl and convert stages
+    manifest: see _load_manifest, updated in place
+    offline: take items from manifest without any request, only converting pdf files without markup file
+    backfill: see _crawling
+    """
+    report=report or _RunReport()
+    if manifest is None:
+        manifest=_load_manifest()
+    with report.stage('crawl') as stage:
+        if offline:
+            items=_manifest_items(manifest)
+            # the period of weekly bulletins comes from their title, which indexing the pdf files cannot give
+            monthly=set(x[0] for x in MONTH_DATA)
+            untitled=[x[0] for x in items if not x[4] and x[2] not in monthly]
+            if untitled:
+                raise ValueError('no title of bulletins {} in the manifest, run once without --offline to fetch '
+                                 'them from the listings'.format(', '.join(untitled)))
+            crawling=[x for x in items if not _get_storage().exists(x[3])]
+        else:
+            items, crawling=_crawling(latest_crawl, base_url, workers, rate, manifest, backfill)
+        stage['rows']=len(crawling)
+        stage['listed']=len(items)
+    if not convert:
+        crawling=[]
+
+    ## covert crawled pdf to html using pdf2tag
+    with report.stage('convert') as stage:
+        _convert_pdfs([x[1] for x in crawling], jobs, report)
+        stage['rows']=len(crawling)
+    return items
+
+def _get_listing(index_url, listing, limiter=None):
+    """
+    (id, title) of every bulletin in listing page index_url
+    listing: manifest entry of the page, updated in place; the page is not parsed again when unchanged on the server
+    """
+    if limiter:
+        limiter.wait()
+    page=_get_session().get(index_url, headers=_conditional_headers(listing))
+    if page.status_code==304:
+        logging.debug('{} is not modified'.format(index_url))
+        return [tuple(x) for x in listing['items']]
+    page.raise_for_status()
+    page.encoding='utf8'
+    pageSoup=bs4.BeautifulSoup(page.text, 'lxml')
+    datas=pageSoup.find_all(attrs={'data-id':True})
+    # pagination links, which may only show a window of pages
+    pages=[int(x) for a in pageSoup.find_all('a', href=True) for x in re.findall('[?&]p=(\d+)', a['href'])]
+    listing.update({'etag':page.headers.get('ETag'), 'last_modified':page.headers.get('Last-Modified'),
+                    'items':[(x.get('data-id'), x.select('td')[1].text) for x in datas],
+                    'last_page':max(pages) if pages else None})
+    return [tuple(x) for x in listing['items']]
+
+def _walk_listing(index_url, listings, known, limiter=None, workers=DOWNLOAD_WORKERS, backfill=False):
+    """
+    (id, title) of bulletins in the pages of listing index_url, newest first
+    pages after the first one are fetched in batches of `workers` concurrent requests, until a page lists an id of
+    known (bulletins already in the local archive) or, with backfill, until the last page
+    listings: manifest entries of listing pages, see _load_manifest
+    """
+    listed=_get_listing(index_url, listings.setdefault(index_url, {}), limiter)
+    last_page=listings[index_url].get('last_page') or 1
+    done=not backfill and any(x[0] in known for x in listed)
+    page=2
+    while not done and page<=last_page:
+        urls=[LISTING_PAGE.format(index_url, x) for x in range(page, min(page+workers, last_page+1))]
+        for url in urls:
+            listings.setdefault(url, {})
+        pool=ThreadPool(len(urls))
+        try:
+            results=pool.map(lambda url: _get_listing(url, listings[url], limiter), urls)
+        finally:
+            pool.close()
+            pool.join()
+        for url, items in zip(urls, results):
+            listed.extend(items)
+            last_page=max(last_page, listings[url].get('last_page'))
+            done=done or not items or (not backfill and any(x[0] in known for x in items))
+        page+=len(urls)
+    logging.debug('{} pages of {} listed {} bulletins'.format(page-1, index_url, len(listed)))
+    return listed
+
+def _conditional_headers(listing):
+    """headers of a request of a listing page answered by a 304 when unchanged since listing (see _get_listing)"""
+    headers={}
+    if listing.get('items') is not None:
+        if listing.get('etag'):
+            headers['If-None-Match']=listing['etag']
+        if listing.get('last_modified'):
+            headers['If-Modified-Since']=listing['last_modified']
+    return headers
+
+def _listing_urls(base_url=TFI_URL):
+    return ['{}/BoxOfficeBulletin/{}'.format(base_url, x) for x in LISTINGS]
+
+def _downloaded_ids(manifest):
+    return set(x for x, y in manifest['bulletins'].items() if y.get('sha1'))
+
+def _archived_ids(name=MANIFEST_NAME):
+    """ids of bulletins downloaded to the local archive, without indexing an archive which has no manifest yet"""
+    storage=_get_storage()
+    if not storage.exists(name):
+        return set(x.split('.')[0] for x in storage.list() if x.endswith('.pdf') and '/' not in x)
+    return _downloaded_ids(json.loads(storage.get(name)))
+
+def _new_ids(base_url, listings, archived, limiter=None):
+    """
+    ids listed in the first page of every listing which are not in archived, shared by check and watch mode
+    only the http stack is used: ids are matched in the listing pages instead of parsing them, and an unchanged
+    page (see _get_listing) costs a 304; listings (see _load_manifest) are not updated, crawls do
+    """
+    new=[]
+    for index_url in _listing_urls(base_url):
+        listing=listings.get(index_url, {})
+        if limiter:
+            limiter.wait()
+        page=_get_session().get(index_url, headers=_conditional_headers(listing))
+        if page.status_code==304:
+            ids=[x[0] for x in listing['items']]
+        else:
+            page.raise_for_status()
+            ids=re.findall('data-id=["\']?(\d+)', page.text)
+        new.extend(x for x in ids if x not in archived and x not in new)
+    return new
+
+def check(base_url=TFI_URL, manifest_name=MANIFEST_NAME):
+    """fast path: ids listed in the first page of every listing which are not in the local archive, see _new_ids"""
+    listings={}
+    if _get_storage().exists(manifest_name):
+        listings=json.loads(_get_storage().get(manifest_name))['listings']
+    return _new_ids(base_url, listings, _archived_ids(manifest_name))
+
+def _poll_listings(base_url=TFI_URL, rate=DOWNLOAD_RATE, manifest=None):
+    """
+    ids listed in the first page of every listing which are not downloaded yet, see _new_ids and _crawling for the
+    full crawl
+    """
+    if manifest is None:
+        manifest=_load_manifest()
+    return _new_ids(base_url, manifest['listings'], _downloaded_ids(manifest), _RateLimiter(rate))
+
+def _crawling(latest_crawl=None, base_url=TFI_URL, workers=DOWNLOAD_WORKERS, rate=DOWNLOAD_RATE, manifest=None,
+              backfill=False):
+    """
+    return (items, crawling): every listed item, and items whose pdf file needs conversion
+    manifest: see _load_manifest, updated in place with listing pages and downloaded files
+    backfill: walk every listing page, not only the pages down to the first bulletin already downloaded
+    """
+    limiter=_RateLimiter(rate)
+    if manifest is None:
+        manifest=_load_manifest()
+    bulletins=manifest['bulletins']
+
+    # get box office pdf of every listing page down to the ones already crawled
+    # (every page on the first crawl with a manifest, which has no title of earlier bulletins yet)
+    known=_downloaded_ids(manifest) if manifest['listings'] else set()
+    listed=[]
+    for index_url in _listing_urls(base_url):
+        listed.extend(_walk_listing(index_url, manifest['listings'], known, limiter, workers, backfill))
+    # bulletins listed in pages which were not walked this time
+    listed_ids=set(x[0] for x in listed)
+    listed.extend((x, y['title']) for x, y in bulletins.items() if x not in listed_ids and y.get('title') is not None)
+    ids=[x[0] for x in listed]
     
     # preparing path    
-    paths=['raw\\{}.pdf'.format(x) for x in ids]
-    tag_files=['raw\\{}.tag'.format(x) for x in ids]   
+    paths=['{}.pdf'.format(x) for x in ids]
+    tag_files=[_tag_name(x) for x in paths]
     fileNames=['{}.pdf'.format(x) for x in ids]
-    titles=[x.select('td')[1].text for x in data_list]
+    titles=[x[1] for x in listed]
     uris=ids # tmp assign 
+    for x, fileName, title in zip(ids, fileNames, titles):
+        bulletins.setdefault(x, {'fileName':fileName})['title']=title
     
     # filter crawling list using "latest_crawl"
     items=list(set(zip(uris, paths, fileNames, tag_files, titles)))
@@ -204,95 +1031,80 @@ def _preprocessing(latest_crawl=None):
         crawling=items[latest_crawl*-1:]
     else:
         # skip pdf files which has been crawled    
-        pdfs=glob.glob('raw\\*.pdf')
-        crawling=[x for x in  items if x[1] not in pdfs]
+        crawling=[x for x in  items if not bulletins[x[0]].get('sha1')]
 
 
     # if there is if sth to crawl
     if crawling:
+        pool=ThreadPool(min(workers, len(crawling)))
+
         ## fetch uri for crawling pdf
-        for idx, crawl_item in enumerate(crawling):  
+        def fetch_uri(crawl_item):
             try:
-                uri=u'https://www.tfi.org.tw'+_get_pdf_file_name(crawl_item[0])
-                crawling[idx]=(uri, crawl_item[1], crawl_item[2], crawl_item[3], crawl_item[4])
-                time.sleep(1)
+                uri=base_url+_get_pdf_file_name(crawl_item[0], base_url, limiter)
+                return (uri, crawl_item[1], crawl_item[2], crawl_item[3], crawl_item[4])
             except Exception as e:
-                print '[ERROR] error to fetch url at idx {}: file {}'.format(idx,x)
+                print '[ERROR] error to fetch url of file {}'.format(crawl_item[2])
                 print e
+        crawling=[x for x in pool.map(fetch_uri, crawling) if x is not None]
     
         logging.debug('crawling: {}'.format(crawling.__str__()))
     
         ## crawling
-        for uri, path, fileName, tag_file, title in crawling:
-            #logging.debug('fetching uri= {}, filePath= {}'.format(uri, path))
-            with open(path,'wb') as out:
-                rep=requests.get(uri, stream=True, verify=False)
-                rep.raw.decode_content = True
-                shutil.copyfileobj(rep.raw, out)
-                time.sleep(1)
+        def download(crawl_item):
+            uri, path, fileName, tag_file, title=crawl_item
+            logging.debug('fetching uri= {}, filePath= {}'.format(uri, path))
+            return _download_pdf(uri, path, limiter)
+        try:
+            changed=pool.map(download, crawling)
+        finally:
+            pool.close()
+            pool.join()
+        now=datetime.datetime.now().isoformat()
+        for (uri, path, fileName, tag_file, title), y in zip(crawling, changed):
+            entry=bulletins[fileName.split('.')[0]]
+            entry['url']=uri
+            if y or not entry.get('sha1'):
+                entry.update({'sha1':_file_sha1(path), 'downloaded':now})
+        # unchanged pdf files need no conversion
+        crawling=[x for x, y in zip(crawling, changed) if y or not _get_storage().exists(x[3])]
     
-                    
-        ## covert crawled pdf to html using pdf2tag
-        for uri, path, fileName, tag_files, title in crawling:        
-            sp.check_call('bin\\pdf2tag\\pdf2tag.exe {}'.format(path), shell=True)        
-    
-    return items
+    return items, crawling
 
-def _parse_page(fileName, pages, page_idx, latest_idx):
+def _parse_page(fileName, pageNum, elements, page_idx, is_last, latest_idx):
+    """
+    elements: texts of non-empty <p> of the page, see _iter_pages
+    """
     #preparins
-    file_attr=_file_type(fileName)
-    if file_attr.has_key('skip'):
+    layout=_get_layout(fileName)
+    if layout['skip']:
         logging.debug('skip parsing {} as setting in file_type'.format(fileName))
         return ([])
-    page=pages[page_idx]
    
     # start logging
-    pageNum=page.get('id')
     logging.debug('start parsing {}, page {}'.format(fileName ,pageNum))    
     
     # parse content
-    elements=[x.text for x in page.select('p') if x.text] # filter empty lines
+    elements=list(elements)
     
     ## ad-hoc parse content fix
-    if file_attr.has_key('drop_annotation') and page_idx+1==len(pages):
+    if layout['drop_annotation'] and is_last:
         elements=elements[:-1]
         
-    if file_attr.has_key('impute_cols'):
-        for impute_dict in file_attr['impute_cols']:           
-            if impute_dict['page_idx']==page_idx:
-                for insert_idx, c in impute_dict['insert']:
-                    elements.insert(insert_idx, c)
-                    
-    if file_attr.has_key('no_header') and page_idx!=0:
-        file_attr['strt_idx']=0
+    for insert_idx, c in layout['impute'].get(page_idx, []):
+        elements.insert(insert_idx, c)
 
     # split lines
-    line_idx = range(file_attr['strt_idx'],len(elements),file_attr['ncols'])
-    line_idx.append(line_idx[-1]+file_attr['ncols'])
-    line_idx_range = zip(line_idx[:-1], line_idx[1:])
-    lines=[]
-    for i,j in line_idx_range:
-        lines.append([x for x in elements[i:j]])
+    ncols=layout['ncols']
+    strt_idx=layout['strt_idx'] if page_idx==0 else layout['strt_idx_rest']
+    lines=[elements[i:i+ncols] for i in range(strt_idx, len(elements), ncols)]
 
     # parse line into logical column template
+    sources=layout['sources']
     parsed_lines=[]
     for impute_line_idx, line in enumerate(lines):
-        ## initialize
-        tmp=[]
-        skip=0
-        ## start parsing columns
-        for i in range(NUMBER_OF_LOGICAL_COLUMNS):
-            if i in file_attr['missing_cols']:
-                if i==0:
-                    # missing row number: automatic impute row numbers
-                    tmp.append(latest_idx + (impute_line_idx+1))
-                else:
-                    tmp.append(-1)                   
-                skip += 1
-            else:
-                tmp.append(line[i-skip])
-        ## append to the result list
-        parsed_lines.append([fileName, pageNum]+tmp)
+        row_number=latest_idx + (impute_line_idx+1)
+        parsed_lines.append([fileName, pageNum]+[line[j] if j>=0 else row_number if j==ROW_NUMBER else -1 for j in sources])
               
     # end parsing
     logging.debug('end parsing {}, page {}. Parsed {} lines'.format(fileName ,pageNum, len(parsed_lines)))           
@@ -302,59 +1114,398 @@ def _parse_page(fileName, pages, page_idx, latest_idx):
 
 
 
-def _parsing(item_info):
-    #initialize
+def _parse_file(fileName, source, engine='tag'):
+    """
+    parse file in a single pass, return (lines, pages)
+    pages: (pageNum, expected, parsed) of every page, number of lines expected (see _iter_pages) and parsed
+    engine: 'tag' to parse markup file, 'pdf' to parse pdf file directly
+    """
+    latest_idx=0
     parse=[]
+    pages=[]
+    reader=_iter_pdf_pages if engine=='pdf' else _iter_pages
+    for page_idx, (pageNum, elements, page_count, is_last) in enumerate(reader(source)):
+        parsed_lines=_parse_page(fileName, pageNum, elements, page_idx, is_last, latest_idx)
+        parse.extend(parsed_lines)
+        pages.append((pageNum, page_count, len(parsed_lines)))
+    return parse, pages
+
+def _expected_lines(pages):
+    """number of lines expected in a file, see _parse_file for pages"""
+    return sum(expected for pageNum, expected, parsed in pages)
+
+def _layout_key(fileName, engine='tag'):
+    """fingerprint of what parsing fileName depends on besides its content: parsing logic, engine and layout"""
+    config=repr(sorted(_file_type(fileName).items()))
+    return hashlib.sha1('{}|{}|{}'.format(CACHE_VERSION, engine, config)).hexdigest()
+
+def _cache_key(fileName, content, engine='tag'):
+    return hashlib.sha1(_layout_key(fileName, engine)+'|'+content).hexdigest()
+
+def _cache_name(fileName):
+    """one cache entry per file, holding (key, result) of its latest parse, see _cache_key"""
+    return '{}{}.pkl'.format(CACHE_PREFIX, fileName)
+
+def _parse_file_cached(fileName, source, cache='on', engine='tag'):
+    """
+    parse file and count its lines, return (lines, pages), see _parse_file
+    cache: 'on' to use cached result, 'rebuild' to parse anyway and refresh the cache, 'off' to bypass the cache
+    engine: see _parse_file
+    """
+    if cache=='off':
+        return _parse_file(fileName, source, engine)
 
-    #start parsing!
+    storage=_get_storage()
+    key=_cache_key(fileName, storage.get(source), engine)
+    cache_file=_cache_name(fileName)
+    if cache=='on' and storage.exists(cache_file):
+        cached_key, res=pickle.loads(storage.get(cache_file))
+        if cached_key==key:
+            logging.debug('use cached parsing result of {}'.format(fileName))
+            return res
+
+    res=_parse_file(fileName, source, engine)
+    # replaces the entry of an earlier content or layout of the file
+    storage.put(cache_file, pickle.dumps((key, res), pickle.HIGHEST_PROTOCOL))
+    return res
+
+def _evict_cache(item_info):
+    # evict: entries of files which are no longer listed, and entries of older cache layouts
+    names=set(_cache_name(x[2]) for x in item_info)
+    for x in _get_storage().list(CACHE_PREFIX):
+        if x not in names:
+            _get_storage().remove(x)
+
+def _file_signature(fileName, source, engine='tag'):
+    """signature of a parsed file: stat of its source and its layout key, see _layout_key"""
+    return _get_storage().signature(source)+(_layout_key(fileName, engine),)
+
+def _load_parsed(name=PARSED_NAME):
+    storage=_get_storage()
+    if not storage.exists(name):
+        return {}
+    return pickle.loads(storage.get(name))
+
+def _save_parsed(parsed, item_info, name=PARSED_NAME):
+    # forget files which are no longer listed
+    fileNames=set(x[2] for x in item_info)
+    parsed=dict((k, v) for k, v in parsed.items() if k in fileNames)
+    _get_storage().put(name, pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL))
+
+def _parse_file_job(args):
+    # module level function, so that it can be sent to worker processes
+    return _timed_call(_parse_file_cached, *args)
+
+def iter_rows(item_info, parsed=None, cache='on', jobs=1, engine='tag', report=None, keep_lines=True):
+    """
+    stream parsed lines of every file of item_info (see _preprocessing), in order of item_info
+    yield (fileName, lines): lines are lists of PARSE_COLUMNS values
+    parsed: dict of fileName -> (signature, lines, pages) kept from earlier runs, see _parse_file for pages.
+        Updated in place; files whose markup file and layout have not changed since are not parsed again.
+        Lines are only kept in it with keep_lines, otherwise (signature, None, pages).
+    cache: mode of the parsing cache, see _parse_file_cached
+    jobs: number of worker processes parsing markup files
+    engine: 'tag' to parse markup files, 'pdf' to parse pdf files directly, see _parse_file
+    report: _RunReport recording parsing time and lines of every file
+    """
+    if parsed is None:
+        parsed={}
+    report=report or _RunReport()
+
+    todo=[]
+    signatures={}
     for uri, path, fileName, tag_file, title in item_info:
-        with open(tag_file,'rb') as infile:
-            soup=bs(infile,'lxml')
-        pages=soup.select('page')
-        latest_idx=0
-        for page_idx in range(len(pages)):
-            parsed_lines=_parse_page(fileName, pages, page_idx, latest_idx)
-            parse.extend(parsed_lines)
-    
-    ## end parsing
-    data=pd.DataFrame(parse,columns=['fileName', 'pageNum', 'lineIdx', 'country', 'name', 'pubDate', 'publisher','production','pub_days', 'cur_theaters', 'max_theaters', 'cur_tickets','cur_sales', 'total_tickets', 'total_sales'])
+        source=path if engine=='pdf' else tag_file
+        signatures[fileName]=_file_signature(fileName, source, engine)
+        if fileName in parsed and parsed[fileName][0]==signatures[fileName] and parsed[fileName][1] is not None:
+            logging.debug('reuse parsed lines of {}'.format(fileName))
+        else:
+            todo.append((fileName, source, cache, engine))
+
+    # results come in order of todo, so that output is identical to serial parsing
+    pool=_pool(jobs, todo)
+    if pool:
+        results=pool.imap(_parse_file_job, todo)
+    else:
+        results=(_parse_file_job(x) for x in todo)
+    todo=dict((x[0], x) for x in todo)
+    try:
+        for uri, path, fileName, tag_file, title in item_info:
+            if fileName in todo:
+                (lines, pages), wall, cpu, peak_rss=next(results)
+                parsed[fileName]=(signatures[fileName], lines if keep_lines else None, pages)
+                report.add_file('parse', fileName, wall, cpu, peak_rss, rows=len(lines), count=_expected_lines(pages))
+            else:
+                lines=parsed[fileName][1]
+            yield fileName, lines
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+def iter_chunks(rows, chunk_rows=CHUNK_ROWS):
+    """
+    consume rows of iter_rows into typed data frames of at least chunk_rows lines (see _apply_schema)
+    yield data frames, the last one may be shorter
+    """
+    chunk=[]
+    for fileName, lines in rows:
+        chunk.extend(lines)
+        if len(chunk)>=chunk_rows:
+            yield _apply_schema(pd.DataFrame(chunk, columns=PARSE_COLUMNS))
+            chunk=[]
+    if chunk:
+        yield _apply_schema(pd.DataFrame(chunk, columns=PARSE_COLUMNS))
+
+def _concat_chunks(chunks):
+    """concatenate chunks of iter_chunks, keeping categorical columns categorical"""
+    if not chunks:
+        return _apply_schema(pd.DataFrame([], columns=PARSE_COLUMNS))
+    data=pd.concat([x.drop(CATEGORY_COLUMNS, axis=1) for x in chunks], ignore_index=True)
+    for x in CATEGORY_COLUMNS:
+        data[x]=pd.api.types.union_categoricals([y[x] for y in chunks], sort_categories=True)
+    return data[PARSE_COLUMNS]
+
+def _parsing(item_info, parsed=None, cache='on', jobs=1, engine='tag', report=None, keep_lines=True):
+    """
+    parse every file of item_info into one typed data frame, streaming lines through typed chunks
+    see iter_rows for arguments
+    """
+    rows=iter_rows(item_info, parsed, cache, jobs, engine, report, keep_lines)
+    return _concat_chunks(list(iter_chunks(rows)))
+
+def _apply_schema(data):
+    """
+    compact columns of parsed lines: categoricals for repeated text, sized integers for counts, datetime64 for pubDate
+    a column with malformed values is left as text, so that _normalize reports the values to correct
+    """
+    for x in CATEGORY_COLUMNS:
+        if not pd.api.types.is_categorical_dtype(data[x]):
+            data[x]=data[x].astype('category')
+    for x, dtype in COUNT_DTYPES.items():
+        counts=_parse_counts(data[x])
+        if not (counts.isnull() & data[x].notnull()).any():
+            data[x]=counts if counts.isnull().any() else counts.astype(dtype)
+    dates=_parse_dates(data['pubDate'], '%Y/%m/%d')
+    if not (dates.isnull() & data['pubDate'].notnull()).any():
+        data['pubDate']=dates
     return data
 
 
+#%%% == validation ==
+
+def _check_pages(item_info, parsed):
+    """
+    compare lines parsed from every page with the lines expected in it, as counted while parsing
+    see iter_rows for parsed, files skipped by their layout are not checked
+    return list of {fileName, pageNum, expected, parsed} of inconsistent pages
+    """
+    res=[]
+    for uri, path, fileName, tag_file, title in item_info:
+        if fileName not in parsed or _get_layout(fileName)['skip']:
+            continue
+        for pageNum, expected, lines in parsed[fileName][2]:
+            if expected!=lines:
+                logging.warning('[WARN] Parsed {} lines from {}, page {}. Inconsistent with {} lines expected.'.format(lines, fileName, pageNum, expected))
+                res.append({'fileName':fileName, 'pageNum':pageNum, 'expected':expected, 'parsed':lines})
+    return res
+
+def _check_lines(sizes, parsed):
+    """
+    compare number of lines of every file with the lines expected in it, see iter_rows for parsed
+    sizes: number of lines of every file, see _patch_data
+    return list of {fileName, lines, expected, status} of every file:
+        status: 'ok', 'inconsistent', 'skip' (skipped by its layout) or 'unparsed' (lines of append file only)
+    """
+    res=[]
+    for fileName, x in sizes.iteritems():
+        if fileName not in parsed:
+            logging.info('[INFO] {} lines from {} come from append data only'.format(x, fileName))
+            res.append({'fileName':fileName, 'lines':int(x), 'expected':None, 'status':'unparsed'})
+            continue
+        count_res=_expected_lines(parsed[fileName][2])
+        if count_res==x:
+            logging.info('[INFO] Successfully Parsed {} lines (including append/drop data) from {}'.format(x, fileName))
+        else:
+            logging.warning('[WARN] Parsed {} lines (including append/drop data) from {}. Inconsistent with result of countline {} lines.'.format(x, fileName, count_res))
+        status='skip' if _get_layout(fileName)['skip'] else 'ok' if count_res==x else 'inconsistent'
+        res.append({'fileName':fileName, 'lines':int(x), 'expected':count_res, 'status':status})
+    return res
+
+def _check_rows(data):
+    """
+    vectorized sanity checks of unified data (see _unify_data_fast), NULL (-1) values are not checked:
+        total_decreasing: total tickets or sales lower than in an earlier bulletin (by end_date) of the same film
+        current_over_total: tickets or sales of the period higher than the total
+        negative_count: counts lower than -1
+    return data frame of issues: check, column, fileName, pageNum, lineIdx, name, pubDate, value, bound
+    """
+    issues=[]
+    def report(bad, check, column, bound):
+        if bad.any():
+            issue=data.loc[bad, ['fileName','pageNum','lineIdx','name','pubDate']].copy()
+            issue['fileName']=issue['fileName'].astype(str)
+            issue['check'], issue['column']=check, column
+            issue['value'], issue['bound']=data.loc[bad, column], bound[bad]
+            issues.append(issue)
+            logging.warning('[WARN] {} lines fail check {} of {}'.format(bad.sum(), check, column))
+
+    order=data.sort_values(['name','pubDate','end_date','fileID'], kind='mergesort')
+    group=[order['name'], order['pubDate']]
+    for x in ['total_tickets','total_sales']:
+        # highest total of the earlier bulletins of the film, NULL (-1) never raises it
+        highest=order[x].groupby(group).cummax().groupby(group).shift().reindex(data.index)
+        report((data[x]>=0)&(data[x]<highest), 'total_decreasing', x, highest)
+    for x, y in [('cur_tickets','total_tickets'), ('cur_sales','total_sales')]:
+        report((data[x]>=0)&(data[y]>=0)&(data[x]>data[y]), 'current_over_total', x, data[y])
+    for x in COUNT_COLUMNS:
+        report(data[x]<-1, 'negative_count', x, pd.Series(-1, index=data.index))
+
+    columns=['check','column','fileName','pageNum','lineIdx','name','pubDate','value','bound']
+    if not issues:
+        return pd.DataFrame([], columns=columns)
+    return pd.concat(issues)[columns]
+
+def _validation_report(pages, files, rows, malformed=()):
+    """structured report of _check_pages, _check_lines, _check_rows and malformed values of _normalize, for the run report"""
+    checks=rows['check'].value_counts()
+    return {'pages':pages,
+            'malformed':[dict(zip(SUP_KEYS+['column','value'], map(unicode, x))) for x in malformed],
+            'files':files,
+            'inconsistent_files':sum(1 for x in files if x['status']=='inconsistent'),
+            'rows':{'counts':dict((k, int(v)) for k, v in checks.iteritems()),
+                    'issues':json.loads(rows.to_json(orient='records', date_format='iso', force_ascii=False))}}
+
 
 #%%% == data formating ==
 
-def _processing_sup_data(data, sup_data_path, appending=False):       
-    logging.debug('length of data before processsing supplementing data {}: {}'.format(os.path.basename(sup_data_path) ,len(data)))    
-    
-    #processing
+def _read_sup_data(sup_data_path):
     sup_data=pd.read_csv(sup_data_path ,encoding='utf8',sep='\t', parse_dates=[5], infer_datetime_format=True)
-    check_keys=['fileName','pageNum','lineIdx']
-    for x in check_keys:
+    for x in SUP_KEYS:
         sup_data[x]=sup_data[x].astype(str)
-        data[x]=data[x].astype(str)
-        
-    #drop data
-    drop_index=data.reset_index().merge(sup_data.loc[:,check_keys], on=check_keys, how='inner')['index'] #filtering records by merge
-    data=data[~data.index.isin(drop_index)]
-    
-    # append back data if specified    
-    if appending:          
-        data=data.append(sup_data)     
-    logging.debug('length of data before processsing supplementing data {}: {}'.format(os.path.basename(sup_data_path) ,len(data)))
-    return data
+    return sup_data
+
+def _key_index(data):
+    return pd.MultiIndex.from_arrays([np.asarray(data[x]) for x in SUP_KEYS], names=SUP_KEYS)
+
+def _patch_data(data, appending=None, dropping=None):
+    """
+    apply supplementing data in one pass, matching lines by (fileName, pageNum, lineIdx):
+        appending: path of append file, its lines replace parsed lines of the same key, or are added
+        dropping: path of drop file, lines of the same key are dropped, appended lines included
+    return (data, sizes, unmatched):
+        sizes: number of lines of every file after appending and before dropping, see _check_lines
+        unmatched: keys of the drop file which matched no line
+    """
+    if not (appending or dropping):
+        return data, data.groupby('fileName', observed=True).size(), []
+    logging.debug('length of data before processsing supplementing data: {}'.format(len(data)))
+
+    # key columns are compared as text, converted once (categories of fileName are text already)
+    for x in SUP_KEYS:
+        if not pd.api.types.is_categorical_dtype(data[x]):
+            data[x]=data[x].astype(str)
+    index=_key_index(data)
+    keep=np.ones(len(data), dtype=bool)
+
+    if appending:
+        append=_read_sup_data(appending)
+        append_index=_key_index(append)
+        keep=~index.isin(append_index)
+        added=~append_index.isin(index)
+        if added.any():
+            logging.info('[INFO] {} lines of {} replace no parsed line and are added'.format(added.sum(), os.path.basename(appending)))
+        sizes=pd.concat([data['fileName'][keep], append['fileName']]).value_counts().sort_index()
+    else:
+        sizes=data.groupby('fileName', observed=True).size()
+
+    unmatched=[]
+    if dropping:
+        drop_index=_key_index(_read_sup_data(dropping))
+        matched=index[keep]
+        if appending:
+            matched=matched.append(append_index)
+        unmatched=list(drop_index[~drop_index.isin(matched)])
+        for key in unmatched:
+            logging.warning('[WARN] {} of {} matches no line'.format(key, os.path.basename(dropping)))
+        keep=keep & ~index.isin(drop_index)
+        if appending:
+            append=append[~append_index.isin(drop_index)]
+
+    data=data[keep]
+    if appending:
+        data=_apply_schema(data.append(append))
+    logging.debug('length of data after processsing supplementing data: {}'.format(len(data)))
+    return data, sizes, unmatched
         
 
-def _get_item_detail(row):
-    row['range_type']='monthly'
-    if pd.isnull(row['start_date']):
-        dates=re.findall('\d+',row['title'])
-        row['start_date']='{0}-{1}-{2}'.format(*dates)
-        row['end_date']='{0}-{3}-{4}'.format(*dates)
-        row['range_type']='weekly'
-    row['start_date']=datetime.datetime.strptime(row['start_date'], '%Y-%m-%d')
-    row['end_date']=datetime.datetime.strptime(row['end_date'], '%Y-%m-%d')
-    return row
+def _parse_dates(values, fmt):
+    """
+    vectorized parsing of text dates in format fmt, memoized over repeated values
+    values already parsed (e.g. by read_csv of the append file) are kept, malformed values become NaT
+    """
+    dates=pd.to_datetime(values, format=fmt, errors='coerce', cache=True)
+    failed=values[dates.isnull() & values.notnull()]
+    failed=failed[[not isinstance(x, basestring) for x in failed]]
+    if len(failed):
+        dates[failed.index]=pd.to_datetime(failed, errors='coerce')
+    return dates
+
+def _parse_counts(values):
+    """vectorized cast of counts like '1,234' to int, malformed values become NaN"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    return pd.to_numeric(values.astype(str).str.replace(',',''), errors='coerce')
+
+def _get_item_data(item_info):
+    """
+    period of every file: from MONTH_DATA for monthly files, or from the title for weekly files
+    return item_data: fileName, title, start_date, end_date, range_type, fileID
+    """
+    item_data=pd.DataFrame([(x[2],x[4]) for x in item_info], columns=['fileName','title'])    
+    mon_item=pd.DataFrame(MONTH_DATA,columns=['fileName','start_date','end_date'])
+    item_data=item_data.merge(mon_item,on='fileName',how='left')
+    weekly=item_data['start_date'].isnull()
+    item_data['range_type']='monthly'
+    item_data.loc[weekly, 'range_type']='weekly'
+    # weekly title: yyyy年mm/dd-mm/dd
+    dates=item_data.loc[weekly, 'title'].str.extract('(\d+)\D+(\d+)\D+(\d+)\D+(\d+)\D+(\d+)')
+    item_data.loc[weekly, 'start_date']=dates[0]+'-'+dates[1]+'-'+dates[2]
+    item_data.loc[weekly, 'end_date']=dates[0]+'-'+dates[3]+'-'+dates[4]
+    for x in ['start_date','end_date']:
+        item_data[x]=pd.to_datetime(item_data[x], format='%Y-%m-%d', errors='coerce')
+    malformed=item_data[item_data[['start_date','end_date']].isnull().any(axis=1)]
+    for fileName, title in malformed[['fileName','title']].values:
+        logging.warning(u'[WARN] no period found in title of {}: {}'.format(fileName, title))
+    item_data['fileID']=item_data['fileName'].str.split('.').str[0].astype('int32')
+    for x in ['title','range_type']:
+        item_data[x]=item_data[x].astype('category')
+    return item_data
+
+def _normalize(data):
+    """
+    vectorized normalization: pubDate to datetime, counts to int (-1 for NULL), names stripped
+    malformed values are reported rather than raised: lines of malformed pubDate are dropped, malformed counts become -1
+    return (data, malformed): malformed is a list of (fileName, pageNum, lineIdx, column, value)
+    """
+    malformed=[]
+    def report(bad, column):
+        for x in data.loc[bad, SUP_KEYS+[column]].values:
+            logging.warning(u'[WARN] malformed {} in {} page {} line {}: {}'.format(column, *x))
+            malformed.append(tuple(x[:3])+(column, x[3]))
+
+    for x in COUNT_COLUMNS:
+        counts=_parse_counts(data[x])
+        report(counts.isnull(), x)
+        data[x]=counts.fillna(-1).astype(COUNT_DTYPES[x])
+
+    dates=_parse_dates(data['pubDate'], '%Y/%m/%d')
+    report(dates.isnull(), 'pubDate')
+    data['pubDate']=dates
+    data['name']=data['name'].str.strip()
+    if dates.isnull().any():
+        data=data[dates.notnull()].copy()
+    return data, malformed
 
 def _get_pub_weeks(end_date, pubDate):
     a=end_date.isocalendar()[0]-pubDate.isocalendar()[0]
@@ -390,92 +1541,407 @@ def _unify_data(gData):
         
     return gData
 
-def _get_under_ranking(gData, newest_file):
-    if gData['fileID'].max()==newest_file:
-        gData['underRanking']=True
+def _get_iso_calendar(dates):
+    """vectorized (iso_year, iso_week) of a datetime series"""
+    thursday=dates-pd.to_timedelta(dates.dt.dayofweek-3, unit='D')
+    return thursday.dt.year, (thursday.dt.dayofyear-1)//7+1
+
+def _unify_data_fast(data):
+    """
+    vectorized version of data.groupby(['name','pubDate']).apply(_unify_data)
+    rows keep their original order; within a group, 'previous' means previous row in that order
+    """
+    keys=[data['name'], data['pubDate']]
+
+    # all: transform pub_weeks, max_theaters; must transform before monthly
+    theaters=data[['cur_theaters','max_theaters']].max(axis=1).clip(lower=-1)
+    data['max_theaters']=theaters.groupby(keys).cummax()
+
+    end_year, end_week=_get_iso_calendar(pd.to_datetime(data['end_date']))
+    pub_year, pub_week=_get_iso_calendar(pd.to_datetime(data['pubDate']))
+    data['pub_weeks']=((end_year-pub_year)*52+end_week-pub_week+1).astype(float)
+
+    # monthly: manage cur_tickets, cur_sales, cur_theaters
+    monthly=data['range_type']=='monthly'
+    first=data['fileID']==data['fileID'].groupby(keys).transform('min')
+    first_month=monthly & first
+    data.loc[first_month, 'cur_theaters']=data.loc[first_month, 'max_theaters']
+    data.loc[first_month, 'cur_tickets']=data.loc[first_month, 'total_tickets']
+    data.loc[first_month, 'cur_sales']=data.loc[first_month, 'total_sales']
+
+    later_month=monthly & ~first
+    if later_month.any():
+        month_data=data.loc[monthly, ['name','pubDate','total_tickets','total_sales']]
+        last=month_data.groupby(['name','pubDate'])[['total_tickets','total_sales']].shift().fillna(0)
+        last=last.loc[later_month[later_month].index]
+        data.loc[later_month, 'cur_theaters']=-1
+        data.loc[later_month, 'cur_tickets']=data.loc[later_month, 'total_tickets']-last['total_tickets'].astype(int)
+        data.loc[later_month, 'cur_sales']=data.loc[later_month, 'total_sales']-last['total_sales'].astype(int)
+
+    return data
+
+def _check_unify(data):
+    """
+    compare _unify_data_fast against the row-by-row _unify_data, see box_bench.py --verify
+    return rows of the result of _unify_data_fast which differ
+    """
+    expected=data.copy().groupby(['name','pubDate']).apply(_unify_data)
+    res=_unify_data_fast(data.copy())
+    cols=['max_theaters','pub_weeks','cur_theaters','cur_tickets','cur_sales']
+    diff=(expected.loc[res.index, cols]!=res[cols]).any(axis=1)
+    if diff.any():
+        logging.warning('[WARN] unify engines disagree on {} rows'.format(diff.sum()))
+    return res[diff]
+
+def _mark_latest(data, newest_file):
+    """
+    single grouped pass over films (name, pubDate), adding underRanking: whether the film is listed in newest_file
+    return mask of the latest lines of every film, see _get_ranking
+    """
+    keys=data[['name','pubDate']].notnull().all(axis=1)
+    latest_file=data.groupby(['name','pubDate'])['fileID'].transform('max')
+    data['underRanking']=latest_file==newest_file
+    return keys & (data['fileID']==latest_file)
+
+def _get_ranking(data, latest):
+    """latest record of every film, sorted by total_sales; latest: see _mark_latest"""
+    # films in order of name and pubDate first, so that ties of total_sales keep a stable order
+    ranking=data[latest].sort_values(['name','pubDate'], kind='mergesort')
+    return ranking.sort_values('total_sales', ascending=False, kind='mergesort')
+
+def _get_typed_data(data):
+    """
+    copy of data with typed columns for columnar output:
+    datetime64 for dates, int64 for page numbers and counts (-1 for NULL), bool for underRanking
+    """
+    typed=data.copy()
+    for x in ['pubDate','start_date','end_date']:
+        typed[x]=pd.to_datetime(typed[x])
+    for x in ['pageNum','pub_days','pub_weeks','cur_theaters','max_theaters','cur_tickets','cur_sales','total_tickets','total_sales']:
+        typed[x]=pd.to_numeric(typed[x], errors='coerce').fillna(-1).astype('int64')
+    for x in ['fileName','lineIdx']:
+        typed[x]=typed[x].astype(str)
+    typed['underRanking']=typed['underRanking'].astype(bool)
+    return typed
+
+def _format_hist(hist):
+    hist=hist.rename_axis(COLUMN_DICTS, axis=1)
+    return hist.reindex_axis(COLUMN_ORD, axis=1)
+
+def _format_ranking(ranking):
+    ranking=ranking.drop(labels='fileID', axis=1)
+    ranking=ranking.rename_axis(COLUMN_DICTS, axis=1)
+    ranking=ranking.rename_axis({u'最大上映院數':u'上映院數'}, axis=1)
+    return ranking.reindex_axis(RANKING_ORD, axis=1)
+
+def _load_output_state(path=OUTPUT_STATE_PATH):
+    """state of every csv output written by the last run, see _write_csv"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as infile:
+        return json.load(infile)
+
+def _save_output_state(state, path=OUTPUT_STATE_PATH):
+    _save_json(state, path)
+
+def _get_blocks(table, keys):
+    """
+    split table into blocks of consecutive rows of the same key
+    return list of [key, digest, start, stop], digest: sha1 of the hashes of every row of the block
+    """
+    rows=pd.util.hash_pandas_object(table, index=False).values
+    keys=np.asarray(keys)
+    starts=np.flatnonzero(np.r_[True, keys[1:]!=keys[:-1]]) if len(keys) else np.array([], dtype=int)
+    stops=np.r_[starts[1:], len(keys)]
+    return [[unicode(keys[i]), hashlib.sha1(rows[i:j].tobytes()).hexdigest(), int(i), int(j)] for i, j in zip(starts, stops)]
+
+def _write_csv(table, name, keys, state=None):
+    """
+    write table to name.csv block by block, see _get_blocks for keys
+    state: state of name.csv written by the last run, {header, header_end, blocks: [key, digest, end], size, mtime,
+        digest}. Blocks before the first changed one are kept and the rest is written again, which gives the same file
+        as a full rewrite; an unchanged table is not written at all. None to rewrite the whole file
+    return (state, rows): new state of name.csv, number of rows written (None if the file is unchanged);
+        digest of the state is the digest of the whole table
+    """
+    path='{}.csv'.format(name)
+    header=list(table.columns)
+    blocks=_get_blocks(table, keys)
+    digest=hashlib.sha1(json.dumps(header)+''.join(x[1] for x in blocks)).hexdigest()
+    first, offset=0, None
+    if _is_current(state, path) and state['header']==header:
+        old=state['blocks']
+        while first<min(len(old), len(blocks)) and old[first][:2]==blocks[first][:2]:
+            first+=1
+        if first==len(old)==len(blocks):
+            return dict(state, digest=digest), None
+        offset=old[first-1][2] if first else state['header_end']
+        state=dict(state, blocks=old[:first])
+    else:
+        state={'header':header, 'blocks':[]}
+    state['digest']=digest
+
+    rows=blocks[first][2] if first<len(blocks) else len(table)
+    text=_to_csv_text(table.iloc[rows:], header=False)
+    # end of every row: a row is one line, unless a value holds a line break
+    ends=np.flatnonzero(np.frombuffer(text, dtype=np.uint8)==ord('\n'))+1
+    with open(path, 'wb' if offset is None else 'r+b') as out:
+        if offset is None:
+            out.write(_to_csv_text(table.iloc[:0], header=True))
+            state['header_end']=out.tell()
+        else:
+            out.seek(offset)
+            out.truncate()
+        start=out.tell()
+        out.write(text)
+        state['size']=out.tell()
+    state['mtime']=os.path.getmtime(path)
+    if len(ends)==len(table)-rows:
+        state['blocks'].extend([key, digest, start+int(ends[j-rows-1])] for key, digest, i, j in blocks[first:])
     else:
-        gData['underRanking']=False
-    return gData
+        # blocks cannot be located, the next run writes the whole file again
+        state['blocks']=[]
+    return state, len(table)-rows
+
+def _to_csv_text(table, header):
+    if not len(table) and not header:
+        return ''
+    text=table.to_csv(None, header=header, index=False, encoding='utf8', sep='\t')
+    return text.encode('utf8') if isinstance(text, unicode) else text
+
+def _is_current(state, path, digest=None):
+    """whether path is the file recorded in state ({size, mtime, digest}), and holds a table of digest if given"""
+    return bool(state and os.path.exists(path) and os.path.getsize(path)==state['size']
+                and os.path.getmtime(path)==state['mtime'] and (digest is None or state.get('digest')==digest))
+
+def _write_table(table, name, xlsx=True, columnar=None, typed=None, report=None, keys=None, state=None):
+    """
+    write table to name.csv, and name.xlsx if xlsx
+    columnar: 'parquet' or 'feather' to also write typed, the same table with typed columns (see _get_typed_data)
+    report: _RunReport recording every writer as a stage
+    keys, state: only write the blocks of name.csv changed since the last run, see _write_csv;
+        the other files are only written when the table differs from the one they were written from
+        (state['files'], by extension: {digest, size, mtime}). None to rewrite every file
+    return state of name.csv
+    """
+    report=report or _RunReport()
+    if keys is None:
+        keys=np.arange(len(table))
+    with report.stage('write {}.csv'.format(name)) as stage:
+        new_state, rows=_write_csv(table, name, keys, state)
+        stage['rows']=rows
+    digest=new_state['digest']
+    # files skipped in this run (--no-xlsx, no --columnar) keep their state, so that a later run catches them up
+    files=dict((state or {}).get('files', {}))
+    writers=[]
+    if xlsx:
+        writers.append(('xlsx', len(table), lambda path: table.to_excel(path, index=False, encoding='utf8')))
+    if columnar=='parquet':
+        writers.append(('parquet', len(typed), lambda path: typed.to_parquet(path, index=False)))
+    elif columnar=='feather':
+        writers.append(('feather', len(typed), lambda path: typed.reset_index(drop=True).to_feather(path)))
+    for ext, rows, writer in writers:
+        path='{}.{}'.format(name, ext)
+        if _is_current(files.get(ext), path, digest):
+            continue
+        with report.stage('write {}'.format(path)) as stage:
+            writer(path)
+            stage['rows']=rows
+        files[ext]={'digest':digest, 'size':os.path.getsize(path), 'mtime':os.path.getmtime(path)}
+    new_state['files']=files
+    return new_state
 
 #%% == main process ==
 
-def main(latest_crawl, appending, dropping, level='INFO'):
+def main(latest_crawl, appending, dropping, level='INFO', incremental=False, cache='on', jobs=1,
+         rate=DOWNLOAD_RATE, workers=DOWNLOAD_WORKERS, engine='tag', keep_tag=False, xlsx=True, columnar=None,
+         report_path=REPORT_PATH, profile=None, offline=False, backfill=False, rebuild=False, parsed=None):
+    """
+    run the whole process, see docstring of the module for arguments
+    parsed: parsed lines of earlier runs kept in memory (see iter_rows), instead of parsed.pkl of the archive, with incremental
+    return unified data
+    """
     eval('logging.basicConfig(level=logging.{})'.format(level.upper()))
+    if columnar:
+        # optional dependency of the columnar writers, fail before the long run rather than after
+        import pyarrow
+    if profile:
+        import cProfile
+        profiler=cProfile.Profile()
+        profiler.enable()
+    report=_RunReport()
+    manifest=_load_manifest()
     
-    # download pdf files and convert to markup file
-    item_info =_preprocessing(latest_crawl)
+    # download pdf files and convert to markup file (the pdf engine only keeps markup files for debugging)
+    # offline run takes the files in manifest without any request
+    item_info =_preprocessing(latest_crawl, workers=workers, rate=rate, jobs=jobs,
+                              convert=engine=='tag' or keep_tag, report=report, manifest=manifest, offline=offline,
+                              backfill=backfill)
   
-    # parse markup file
-    data =_parsing(item_info)
+    # parse markup file; incremental run only parses files changed since the last run
+    with report.stage('parse') as stage:
+        if parsed is None:
+            parsed=_load_parsed() if incremental else {}
+        data =_parsing(item_info, parsed, cache, jobs, engine, report, keep_lines=incremental)
+        if incremental:
+            _save_parsed(parsed, item_info)
+            # release parsed lines, only their counts are checked from here on (see _check_pages)
+            parsed=dict((k, (v[0], None, v[2])) for k, v in parsed.items())
+        if cache!='off':
+            _evict_cache(item_info)
+        _record_parsed(manifest, item_info, parsed, data)
+        _save_manifest(manifest)
+        stage['rows']=len(data)
 
-    ## manually lines recorded in append file and drop the false-parsed original data  
-    if appending:
-        data=_processing_sup_data(data, appending, True)
+    ## lines of every page against the lines expected in it, counted while parsing
+    with report.stage('check_pages') as stage:
+        pages=_check_pages(item_info, parsed)
+        stage['rows']=len(pages)
 
-    ## loggging number of parsed line in every file
-    for fileName, x in data.groupby('fileName').size().iteritems():
-        count_res=_count_lines('raw\\{}'.format(fileName.replace('pdf','tag')))
-        if count_res==x:
-            logging.info('[INFO] Successfully Parsed {} lines (including append/drop data) from {}'.format(x, fileName))
-        else:
-            logging.warning('[WARN] Parsed {} lines (including append/drop data) from {}. Inconsistent with result of countline {} lines.'.format(x, fileName, count_res))
-        
-    ## drop duplicated and error data recorded in dropping file
-    if dropping:
-        data=_processing_sup_data(data, dropping, False)
+    ## manually lines recorded in append file replace the false-parsed original data;
+    ## duplicated and error data recorded in dropping file are dropped
+    with report.stage('patch') as stage:
+        data, sizes, unmatched=_patch_data(data, appending, dropping)
+        stage['rows']=len(data)
+        stage['unmatched']=len(unmatched)
+
+    ## loggging number of parsed line in every file (including append data, before dropping)
+    with report.stage('check_lines') as stage:
+        files=_check_lines(sizes, parsed)
+        stage['rows']=int(sizes.sum())
 
     ## dump temparay output (before imputation)
-    data.to_csv('box_temp.csv',index=False, encoding='utf8',sep='\t')       
+    with report.stage('write box_temp.csv') as stage:
+        data.to_csv('box_temp.csv',index=False, encoding='utf8',sep='\t')       
+        stage['rows']=len(data)
    
-    ## drop officially duplicated data    
-    data=data[~data.fileName.isin(['40.pdf','41.pdf','42.pdf','43.pdf','44.pdf'])]
+    with report.stage('item_detail') as stage:
+        ## drop officially duplicated data    
+        data=data[~data.fileName.isin(['40.pdf','41.pdf','42.pdf','43.pdf','44.pdf'])]
         
-    ## get Item info data
-    item_data=pd.DataFrame([(x[2],x[4]) for x in item_info], columns=['fileName','title'])    
-    mon_item=pd.DataFrame(MONTH_DATA,columns=['fileName','start_date','end_date'])
-    item_data=item_data.merge(mon_item,on='fileName',how='left')
-    item_data=item_data.apply(_get_item_detail,axis=1)
-    item_data['fileID']=[int(x.split('.')[0]) for x in item_data['fileName']]
-    data=data.merge(item_data,on='fileName')
+        ## get Item info data
+        item_data=_get_item_data(item_info)
+        data=data.merge(item_data,on='fileName')
+        stage['rows']=len(data)
 
-    ## unify monthy and weekly data
-    data=data.groupby(['name','pubDate']).apply(_get_under_ranking, newest_file=item_data['fileID'].max())
-      
     ## col/value formatting
-    data['pubDate']=data['pubDate'].apply(lambda x: datetime.datetime.strptime(x,'%Y/%m/%d') if not isinstance(x,datetime.datetime) else x)
-    for x in ['cur_theaters','max_theaters','cur_tickets','cur_sales','total_tickets','total_sales']:
-        data[x]=[int(str(y).replace(',','')) for y in data[x]]
-    data['name']=data['name'].str.strip()
+    with report.stage('normalize') as stage:
+        data, malformed=_normalize(data)
+        stage['rows']=len(data)
+        stage['malformed']=len(malformed)
+
+    ## films listed in the newest file, and the latest line of every film for the ranking file
+    with report.stage('latest') as stage:
+        latest=_mark_latest(data, item_data['fileID'].max())
+        stage['rows']=int(latest.sum())
 
     ## unify data
-    data=data.groupby(['name','pubDate']).apply(_unify_data,)
+    with report.stage('unify') as stage:
+        data=_unify_data_fast(data)
+        stage['rows']=len(data)
+
+    ## sanity checks of counts across bulletins
+    with report.stage('check_rows') as stage:
+        validation=_validation_report(pages, files, _check_rows(data), malformed)
+        stage['rows']=sum(validation['rows']['counts'].values())
      
-    ## value formating take II
-    data=data.replace(to_replace=-1, value='NULL' )
-    for x in ['pubDate','start_date','end_date']:
-        data[x]= data[x].apply(lambda y:y.date().isoformat())
+    ## typed copy for columnar output, before values are formatted into text
+    with report.stage('format') as stage:
+        typed=_get_typed_data(data) if columnar else None
+
+        ## value formating take II
+        numbers=data.select_dtypes(include='number').columns
+        data[numbers]=data[numbers].replace(to_replace=-1, value='NULL' )
+        for x in ['pubDate','start_date','end_date']:
+            data[x]=pd.to_datetime(data[x]).dt.strftime('%Y-%m-%d')
+        stage['rows']=len(data)
 
-    # file output: history file, ranking file       
+    # file output: history file, ranking file
+    # only blocks changed since the last run are written: bulletins of the history file, films of the ranking file
+    output_state={} if rebuild else _load_output_state()
     hist=data.sort_values(['fileName', 'pageNum', 'lineIdx'])
-    hist=hist.rename_axis(COLUMN_DICTS, axis=1)
-    hist=hist.reindex_axis(COLUMN_ORD, axis=1)
-    hist.to_excel('box_hist.xlsx',index=False, encoding='utf8')
-    hist.to_csv('box_hist.csv',index=False, encoding='utf8',sep='\t')
+    output_state['box_hist']=_write_table(_format_hist(hist), 'box_hist', xlsx, columnar,
+                                          _format_hist(typed.loc[hist.index]) if columnar else None, report,
+                                          hist['fileName'], output_state.get('box_hist'))
 
-    ranking=data.groupby(['name','pubDate']).apply(lambda gData: gData[gData['fileID']==gData['fileID'].max()])
-    ranking=ranking.drop(labels='fileID', axis=1)
-    ranking=ranking.sort_values('total_sales', ascending=False)
-    ranking=ranking.rename_axis(COLUMN_DICTS, axis=1)
-    ranking=ranking.rename_axis({u'最大上映院數':u'上映院數'}, axis=1)
-    ranking=ranking.reindex_axis(RANKING_ORD, axis=1)
-    ranking.to_excel('box.xlsx',index=False, encoding='utf8')
-    ranking.to_csv('box.csv',index=False, encoding='utf8',sep='\t')
+    with report.stage('ranking') as stage:
+        ranking=_get_ranking(data, latest)
+        stage['rows']=len(ranking)
+    output_state['box']=_write_table(_format_ranking(ranking), 'box', xlsx, columnar,
+                                     _format_ranking(typed.loc[ranking.index]) if columnar else None, report,
+                                     ranking['name']+'|'+ranking['pubDate'], output_state.get('box'))
+    _save_output_state(output_state)
+    ranking=_format_ranking(ranking)
    
     #finishing
+    if profile:
+        profiler.disable()
+        profiler.dump_stats(profile)
+    report.dump(report_path, rows=len(data), files_listed=len(item_info), profile=profile, validation=validation,
+                args={'latest_crawl':latest_crawl, 'append':appending, 'drop':dropping, 'incremental':incremental,
+                      'cache':cache, 'jobs':jobs, 'engine':engine, 'xlsx':xlsx, 'columnar':columnar, 'offline':offline,
+                      'backfill':backfill, 'rebuild':rebuild})
     logging.info('[SUCCESS] finish parsing!')
     logging.info('the number of lines from newest file: {} lines'.format(ranking[u'統計中'].sum()))
+    logging.info('run report written to {}'.format(report_path))
     return data
 
+def watch(appending, dropping, interval=WATCH_INTERVAL, status_path=STATUS_PATH, **kwargs):
+    """
+    long-running mode: run main once, then poll the listings every `interval` minutes and run main again
+    whenever new bulletins are listed; parsed lines, layouts and the http session are kept in memory between runs
+    status_path: json status file, rewritten on every poll: state (running, idle, error or stopped), pid,
+        number of polls and runs, last poll, last run (start, wall time, new ids, rows), last error and next poll
+    kwargs: passed to main, every run is incremental
+    a failed run is run again on every poll until it succeeds, and the state stays 'error' until then
+    """
+    parsed=_load_parsed()
+    status={'pid':os.getpid(), 'started':datetime.datetime.now().isoformat(), 'interval':interval,
+            'state':'running', 'polls':0, 'runs':0, 'last_poll':None, 'last_run':None, 'last_error':None}
+    pending=True # run once at start, to bring the outputs up to date
+    new_ids=[] # ids listed since the last successful run
+    try:
+        while True:
+            if pending:
+                try:
+                    status['state']='running'
+                    _save_json(status, status_path)
+                    start, wall=datetime.datetime.now(), time.time()
+                    data=main(None, appending, dropping, incremental=True, parsed=parsed, **kwargs)
+                    status['runs']+=1
+                    status['last_run']={'start':start.isoformat(), 'wall':time.time()-wall, 'new':new_ids,
+                                        'rows':len(data)}
+                    status['state']='idle'
+                    pending, new_ids=False, []
+                except Exception as e:
+                    logging.exception('[ERROR] run of watch mode failed, run again at next poll')
+                    status['state']='error'
+                    status['last_error']={'time':datetime.datetime.now().isoformat(), 'error':repr(e)}
+            status['next_poll']=(datetime.datetime.now()+datetime.timedelta(minutes=interval)).isoformat()
+            _save_json(status, status_path)
+            time.sleep(interval*60)
+
+            # an unchanged listing costs a conditional request per listing
+            new=[]
+            try:
+                new=_poll_listings(rate=kwargs.get('rate', DOWNLOAD_RATE))
+                if new:
+                    pending=True
+                    new_ids=new_ids+new
+                elif not pending:
+                    # error of an earlier poll; an error of a failed run stays until the run succeeds
+                    status['state']='idle'
+            except Exception as e:
+                logging.exception('[ERROR] poll of watch mode failed')
+                status['state']='error'
+                status['last_error']={'time':datetime.datetime.now().isoformat(), 'error':repr(e)}
+            status['polls']+=1
+            status['last_poll']={'time':datetime.datetime.now().isoformat(), 'new':new}
+            logging.info('{} new bulletins listed: {}'.format(len(new), new))
+    finally:
+        status['state']='stopped'
+        _save_json(status, status_path)
+
 #test
 #data=main(latest_crawl=0, skip_crawl=False, ignore_exc=False, appending='raw/append.csv', dropping='raw/drop.csv', level='INFO')
 #%%    
@@ -486,6 +1952,46 @@ if __name__=='__main__':
     parser.add_argument('-a','--append', help='file path of supplementing data, must be tab-delimited file')
     parser.add_argument('-d','--drop')
     parser.add_argument('--level', default='INFO')
+    parser.add_argument('--incremental', action='store_true', help='only parse markup files which changed since the last run')
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const='off', default='on', help='do not read or write the parsing cache')
+    parser.add_argument('--rebuild-cache', dest='cache', action='store_const', const='rebuild', help='parse every markup file again and refresh the parsing cache')
+    parser.add_argument('-j','--jobs', type=int, default=1, help='number of worker processes converting pdf files and parsing markup files')
+    parser.add_argument('--rate', type=float, default=DOWNLOAD_RATE, help='maximum number of requests per second sent to TFI')
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS, help='number of concurrent downloads')
+    parser.add_argument('--engine', choices=['tag','pdf'], default='tag', help="parse markup files ('tag') or pdf files directly ('pdf')")
+    parser.add_argument('--keep-tag', action='store_true', help='with --engine pdf, still write markup files for debugging')
+    parser.add_argument('--no-xlsx', dest='xlsx', action='store_false', help='do not write box_hist.xlsx and box.xlsx')
+    parser.add_argument('--columnar', choices=['parquet','feather'], help='also write typed box_hist and box tables in this format')
+    parser.add_argument('--report', default=REPORT_PATH, help='path of the json run report')
+    parser.add_argument('--profile', help='dump cProfile stats of the run to this path')
+    parser.add_argument('--offline', action='store_true', help='process the bulletins in the manifest of the archive without any request')
+    parser.add_argument('--backfill', action='store_true', help='walk every page of the listings, to fill gaps of the archive')
+    parser.add_argument('--rebuild', action='store_true', help='rewrite every output file, not only the parts changed since the last run')
+    parser.add_argument('--watch', type=float, nargs='?', const=WATCH_INTERVAL, metavar='MINUTES', help='keep running, polling the listings every MINUTES')
+    parser.add_argument('--status', default=STATUS_PATH, help='path of the status file of --watch')
+    parser.add_argument('--check', action='store_true', help='only list new bulletins, exit status 1 if there is none')
+    parser.add_argument('--storage', choices=['fs','sqlite'], default='fs', help='keep the archive as files or in one SQLite file')
+    parser.add_argument('--archive', help='directory (fs) or database file (sqlite) of the archive, default {} or {}'.format(ARCHIVE_ROOT, ARCHIVE_DB))
+    parser.add_argument('--pack', metavar='DB', help='copy the archive into SQLite file DB and exit')
     args=parser.parse_args()
-    main(args.latest_crawl, args.append, args.drop, args.level)
+    if args.storage=='sqlite':
+        set_storage(SqliteStorage(args.archive or ARCHIVE_DB))
+    else:
+        set_storage(FileStorage(args.archive or ARCHIVE_ROOT))
+    if args.pack:
+        copy_storage(_get_storage(), SqliteStorage(args.pack))
+    elif args.check:
+        eval('logging.basicConfig(level=logging.{})'.format(args.level.upper()))
+        new=check()
+        for x in new:
+            print x
+        sys.exit(0 if new else 1)
+    elif args.watch:
+        watch(args.append, args.drop, args.watch, args.status, level=args.level, cache=args.cache, jobs=args.jobs,
+              rate=args.rate, workers=args.download_workers, engine=args.engine, keep_tag=args.keep_tag,
+              xlsx=args.xlsx, columnar=args.columnar, report_path=args.report, backfill=args.backfill)
+    else:
+        main(args.latest_crawl, args.append, args.drop, args.level, args.incremental, args.cache, args.jobs,
+             args.rate, args.download_workers, args.engine, args.keep_tag, args.xlsx, args.columnar,
+             args.report, args.profile, args.offline, args.backfill, args.rebuild)
     
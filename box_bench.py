@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+box_bench: end-to-end benchmark of box.main on a synthetic corpus
+    - Generates synthetic markup (.tag) files for every column template of box._file_type,
+      including the ad-hoc fixes (no_header, drop_annotation, impute_cols, skip), so no TFI data is needed.
+    - Runs box.main on the corpus without crawling, and times every stage separately.
+
+Usage: box_bench.py [-h] [-s N [N ...]] [-n LINES] [-p LINES] [-j JOBS] [--cache] [--verify] [--keep DIR]
+optional arguments:
+    -s, --sizes N [N ...]
+        Number of bulletins of each benchmark run. Default: 100 1000 10000.
+    -n, --lines LINES
+        Number of lines of every bulletin. Default: 40.
+    -p, --lines-per-page LINES
+        Number of lines of every page. Default: 15.
+    -j, --jobs JOBS
+        Passed to box.main. Default: 1.
+    --cache
+        Time a second run, which reads the parsing cache of the first one.
+    --verify
+        Check that the vectorized _unify_data_fast gives the same result as the row-by-row _unify_data on the data of
+        every corpus (see box._check_unify), exit with status 1 if they disagree. _unify_data is slow: use small sizes.
+    --keep DIR
+        Generate the corpora under DIR and keep them, instead of a temporary directory.
+
+Output:
+    one line per run and stage: size, stage, seconds, calls
+    with --verify, one more line per size: size, 'verify', 'unify', seconds, number of rows the engines disagree on
+
+Example Usage:
+    python box_bench.py -s 100 1000
+    python box_bench.py -s 10000 -j 4 --cache
+    python box_bench.py -s 10 60 --verify
+"""
+import os
+import io
+import sys
+import time
+import shutil
+import random
+import logging
+import datetime
+import tempfile
+import collections
+import pandas as pd
+import box
+
+#%% == synthetic corpus ==
+
+HEADERS=[u'序號',u'國別地區',u'中文片名',u'上映日期',u'申請人',u'出品',u'上映院數',u'銷售票數',u'銷售金額',u'累計銷售票數',u'累計銷售金額']
+
+COUNTRIES=[u'美國',u'日本',u'中華民國',u'南韓',u'法國',u'英國']
+
+SUP_COLUMNS=['fileName', 'pageNum', 'lineIdx', 'country', 'name', 'pubDate', 'publisher','production','pub_days',
+             'cur_theaters', 'max_theaters', 'cur_tickets','cur_sales', 'total_tickets', 'total_sales']
+
+MONTH_IDS=[int(x[0].split('.')[0]) for x in box.MONTH_DATA]
+
+
+def _corpus_ids(size):
+    """file ids of a corpus of size bulletins: the monthly ones first, as in the real archive"""
+    ids=MONTH_IDS[:size]
+    return ids+range(MONTH_IDS[-1]+1, MONTH_IDS[-1]+1+size-len(ids))
+
+def _make_title(file_id, week):
+    if file_id in MONTH_IDS:
+        return u'全國電影票房截至{}月前資訊'.format(file_id)
+    start=datetime.date(2017,6,5)+datetime.timedelta(days=7*week)
+    end=start+datetime.timedelta(days=6)
+    return u'全國電影票房{}年{:02d}/{:02d}-{:02d}/{:02d}統計資訊'.format(start.year, start.month, start.day, end.month, end.day)
+
+def _make_lines(file_id, films, rnd):
+    """logical columns of every line, see docstring of box._file_type"""
+    lines=[]
+    for idx, film in enumerate(films):
+        film['tickets']+=rnd.randint(0,3000)
+        theaters=rnd.randint(1,120)
+        lines.append([str(idx+1), film['country'], film['name'], film['pubDate'].strftime('%Y/%m/%d'),
+                      u'發行商{}'.format(idx), u'PRODUCTION {}'.format(idx), str(rnd.randint(1,200)),
+                      str(theaters), str(max(theaters, film['theaters'])), '{:,}'.format(rnd.randint(1,3000)),
+                      '{:,}'.format(rnd.randint(250,750000)), '{:,}'.format(film['tickets']), '{:,}'.format(film['tickets']*250)])
+    return lines
+
+def make_tag_file(fileName, lines, lines_per_page):
+    """
+    render lines as a pdf2tag markup file laid out as box._file_type expects for fileName
+    return content of the file
+    """
+    attr=box._file_type(fileName)
+    pages=[lines[i:i+lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    out=io.BytesIO()
+    for page_idx, page in enumerate(pages):
+        elements=[]
+        if not ('no_header' in attr and page_idx!=0):
+            elements.extend(HEADERS[:attr['strt_idx']])
+        for line in page:
+            elements.extend(x for i, x in enumerate(line) if i not in attr['missing_cols'])
+        if 'drop_annotation' in attr and page_idx+1==len(pages):
+            elements.append(u'註：本表僅供參考')
+        # cells lost in the pdf, which _parse_page inserts back
+        for impute_dict in attr.get('impute_cols', []):
+            if impute_dict['page_idx']==page_idx:
+                for insert_idx, c in reversed(impute_dict['insert']):
+                    if insert_idx<len(elements):
+                        del elements[insert_idx]
+        out.write('<page id="{}" bbox="0.000,0.000,842.000,595.000" rotate="0">'.format(page_idx))
+        for mcid, x in enumerate(elements):
+            out.write(u'<P MCID="{}">{}</P>'.format(mcid, x).encode('utf8'))
+        out.write('</page>\n')
+    return out.getvalue()
+
+def make_corpus(size, lines=40, lines_per_page=15, seed=0):
+    """
+    write a corpus of size bulletins into the storage of box (see box.set_storage), with append and drop files
+    into the working directory
+    return item_info, as returned by box._preprocessing
+    """
+    rnd=random.Random(seed)
+    storage=box._get_storage()
+    films=collections.deque()
+    film_count=0
+    item_info=[]
+    for week, file_id in enumerate(_corpus_ids(size)):
+        # every bulletin: some films leave the ranking, new films come in
+        for _ in range(min(len(films), rnd.randint(0, lines//4))):
+            films.popleft()
+        while len(films)<lines:
+            films.append({'name':u'電影{}'.format(film_count), 'country':rnd.choice(COUNTRIES),
+                          'pubDate':datetime.date(2016,10,1)+datetime.timedelta(days=film_count//7),
+                          'tickets':0, 'theaters':rnd.randint(1,120)})
+            film_count+=1
+        fileName='{}.pdf'.format(file_id)
+        tag_file='{}.tag'.format(file_id)
+        storage.put(tag_file, make_tag_file(fileName, _make_lines(file_id, films, rnd), lines_per_page))
+        item_info.append((str(file_id), fileName, fileName, tag_file, _make_title(file_id, week)))
+
+    # supplementing data: replace a line, add the lines of a skipped file; drop a line
+    last=item_info[-1][2]
+    append=[(last, '0', '1', u'美國', u'補充電影', '2017-10-31', u'發行商', u'PRODUCTION', -1, 1, -1, 1, 100, 4, 590)]
+    append.extend((x[2], '0', str(idx+1), u'美國', u'補充電影{}'.format(idx), '2017-10-31', u'發行商', u'PRODUCTION', -1, 1, -1, 1, 100, 4, 590)
+                  for x in item_info if 'skip' in box._file_type(x[2]) for idx in range(lines))
+    pd.DataFrame(append, columns=SUP_COLUMNS).to_csv('append.csv', index=False, encoding='utf8', sep='\t')
+    drop=[(item_info[0][2], '0', '2', '', u'刪除電影', '2017-10-31')]
+    pd.DataFrame(drop, columns=SUP_COLUMNS[:6]).to_csv('drop.csv', index=False, encoding='utf8', sep='\t')
+    return item_info
+
+#%% == timing ==
+
+STAGES=[('parse','_parsing'),
+        ('sup_data','_patch_data'),
+        ('count_lines','_check_lines'),
+        ('unify','_unify_data_fast'),
+        ('ranking','_get_ranking'),
+        ('output','_write_table')]
+
+def _timed(func, timings, stage):
+    def wrapper(*args, **kwargs):
+        start=time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[stage][0]+=time.time()-start
+            timings[stage][1]+=1
+    return wrapper
+
+def run(item_info, jobs=1):
+    """run box.main on a corpus in the working directory, return {stage: [seconds, calls]}"""
+    timings=collections.OrderedDict((stage, [0.0, 0]) for stage, _ in STAGES+[('total',None)])
+    originals=dict((name, getattr(box, name)) for _, name in STAGES+[('', '_preprocessing')])
+    try:
+        box._preprocessing=lambda *args, **kwargs: item_info
+        for stage, name in STAGES:
+            setattr(box, name, _timed(originals[name], timings, stage))
+        _timed(box.main, timings, 'total')(None, 'append.csv', 'drop.csv', 'WARNING', jobs=jobs)
+    finally:
+        for name, func in originals.items():
+            setattr(box, name, func)
+    timings['other']=[timings['total'][0]-sum(v[0] for k, v in timings.items() if k!='total'), 1]
+    return timings
+
+def verify(item_info):
+    """
+    run box.main on a corpus in the working directory, and compare both unify engines on the data it unifies
+    return rows on which _unify_data_fast disagrees with _unify_data, see box._check_unify
+    """
+    inputs=[]
+    originals=dict((name, getattr(box, name)) for name in ['_preprocessing', '_unify_data_fast'])
+    def capture(data):
+        inputs.append(data.copy())
+        return originals['_unify_data_fast'](data)
+    try:
+        box._preprocessing=lambda *args, **kwargs: item_info
+        box._unify_data_fast=capture
+        box.main(None, 'append.csv', 'drop.csv', 'WARNING', xlsx=False)
+    finally:
+        for name, func in originals.items():
+            setattr(box, name, func)
+    return box._check_unify(inputs[0])
+
+def main(sizes, lines=40, lines_per_page=15, jobs=1, cache=False, keep=None, check=False):
+    """return number of rows the unify engines disagree on, with check (see verify)"""
+    cwd=os.getcwd()
+    root=keep or tempfile.mkdtemp(prefix='box_bench')
+    disagree=0
+    print '\t'.join(['size', 'run', 'stage', 'seconds', 'calls'])
+    try:
+        for size in sizes:
+            work=os.path.join(root, str(size))
+            if os.path.isdir(work):
+                shutil.rmtree(work)
+            os.makedirs(work)
+            os.chdir(work)
+            item_info=make_corpus(size, lines, lines_per_page)
+            for run_name in (['cold', 'cached'] if cache else ['cold']):
+                for stage, (seconds, calls) in run(item_info, jobs).items():
+                    print '\t'.join([str(size), run_name, stage, '{:.3f}'.format(seconds), str(calls)])
+                sys.stdout.flush()
+            if check:
+                start=time.time()
+                rows=len(verify(item_info))
+                disagree+=rows
+                print '\t'.join([str(size), 'verify', 'unify', '{:.3f}'.format(time.time()-start), str(rows)])
+                sys.stdout.flush()
+            os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(root)
+    return disagree
+
+#%%
+if __name__=='__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s','--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('-n','--lines', type=int, default=40)
+    parser.add_argument('-p','--lines-per-page', type=int, default=15)
+    parser.add_argument('-j','--jobs', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='time a second run reading the parsing cache')
+    parser.add_argument('--verify', action='store_true', help='check _unify_data_fast against _unify_data on every corpus')
+    parser.add_argument('--keep', help='keep generated corpora under this directory')
+    args=parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if main(args.sizes, args.lines, args.lines_per_page, args.jobs, args.cache, args.keep, args.verify):
+        sys.exit(1)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+box_query: query the history file written by box.py
+    - box_hist.csv is loaded into an indexed SQLite database (box_hist.sqlite), rebuilt whenever box_hist.csv is newer.
+    - Indexed lookups: film (name, pubDate), period (start_date, end_date) and bulletin (fileName).
+    - Columns are named as in box.py (see box.COLUMN_DICTS), NULL values of box_hist.csv are SQL NULL.
+    - top only reads the lines of its period: EXPLAIN QUERY PLAN of TOP_N_SQL gives
+      'SEARCH hist USING INDEX period (start_date>? AND start_date<?)', about 0.1 ms on a history of 35,800 lines.
+
+Usage: box_query.py [-h] [--hist HIST] [--db DB] {film,top,bulletin} ...
+    film NAME [--pub-date DATE]
+        Every line of film NAME (published on DATE), in order of bulletins.
+    top START END [-n N] [--by {cur_sales,cur_tickets}]
+        Top N films by sales (or tickets) of the bulletins within START and END, dates in yyyy-mm-dd.
+    bulletin FILENAME
+        Every line of bulletin FILENAME, e.g. 120.pdf.
+
+Example Usage:
+    >>> import box_query
+    >>> con=box_query.connect()
+    >>> box_query.film_series(con, u'電影名稱')
+    >>> box_query.top_n(con, '2018-01-01', '2018-01-31', 10)
+    python box_query.py top 2018-01-01 2018-01-31 -n 10
+"""
+import os
+import sqlite3
+import pandas as pd
+import box
+
+HIST_PATH='box_hist.csv'
+DB_PATH='box_hist.sqlite'
+
+COLUMN_TYPES=[('title','TEXT'), ('fileName','TEXT'), ('pageNum','INTEGER'), ('lineIdx','INTEGER'),
+              ('name','TEXT'), ('pubDate','TEXT'), ('country','TEXT'), ('publisher','TEXT'), ('production','TEXT'),
+              ('start_date','TEXT'), ('end_date','TEXT'), ('range_type','TEXT'),
+              ('cur_theaters','INTEGER'), ('cur_tickets','INTEGER'), ('cur_sales','INTEGER'), ('pub_days','INTEGER'),
+              ('pub_weeks','REAL'), ('max_theaters','INTEGER'), ('total_tickets','INTEGER'), ('total_sales','INTEGER'),
+              ('underRanking','INTEGER')]
+
+INDEXES={'film':['name','pubDate','start_date'],
+         'period':['start_date','end_date'],
+         'bulletin':['fileName','pageNum','lineIdx']}
+
+RANKING_VALUES=['cur_sales','cur_tickets'] # values which top_n can rank films by
+
+# a bulletin within start and end starts within them: the range of start_date bounds the scan of the period index,
+# which the planner would otherwise pass over for the film index, serving GROUP BY but scanning every line
+TOP_N_SQL=('SELECT name, pubDate, SUM({0}) AS total, COUNT(*) AS bulletins FROM hist INDEXED BY period '
+           'WHERE start_date>=? AND start_date<=? AND end_date<=? AND {0} IS NOT NULL '
+           'GROUP BY name, pubDate ORDER BY total DESC LIMIT ?')
+
+#%% == database ==
+
+def _value(x):
+    if x in ('NULL', 'NaT', ''):
+        return None
+    return {'True':1, 'False':0}.get(x, x)
+
+def build(hist_path=HIST_PATH, db_path=DB_PATH):
+    """load hist_path (see box.main) into a new database db_path"""
+    hist=pd.read_csv(hist_path, encoding='utf8', sep='\t', dtype=object, keep_default_na=False)
+    header=dict((v, k) for k, v in box.COLUMN_DICTS.items())
+    hist=hist.rename(columns=header)[[x for x, _ in COLUMN_TYPES]]
+
+    tmp_path=db_path+'.part'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con=sqlite3.connect(tmp_path)
+    try:
+        con.execute('CREATE TABLE hist ({})'.format(', '.join('{} {}'.format(x, y) for x, y in COLUMN_TYPES)))
+        # integer affinity turns numbers in text into integers
+        con.executemany('INSERT INTO hist VALUES ({})'.format(', '.join(['?']*len(COLUMN_TYPES))),
+                        ([_value(x) for x in row] for row in hist.values))
+        for name, columns in INDEXES.items():
+            con.execute('CREATE INDEX {} ON hist ({})'.format(name, ', '.join(columns)))
+        # statistics of the indexes for the query planner
+        con.execute('ANALYZE')
+        con.commit()
+    finally:
+        con.close()
+    box._replace(tmp_path, db_path)
+
+def connect(hist_path=HIST_PATH, db_path=DB_PATH):
+    """connection to the database of hist_path, (re)built first when hist_path is newer"""
+    if not os.path.exists(db_path) or os.path.getmtime(hist_path)>os.path.getmtime(db_path):
+        build(hist_path, db_path)
+    con=sqlite3.connect(db_path)
+    con.row_factory=sqlite3.Row
+    return con
+
+#%% == queries ==
+
+def film_series(con, name, pubDate=None):
+    """every line of film name (published on pubDate, yyyy-mm-dd), in order of bulletins"""
+    if pubDate is None:
+        return con.execute('SELECT * FROM hist WHERE name=? ORDER BY start_date, pubDate', (name,)).fetchall()
+    return con.execute('SELECT * FROM hist WHERE name=? AND pubDate=? ORDER BY start_date', (name, pubDate)).fetchall()
+
+def top_n(con, start, end, n=10, by='cur_sales'):
+    """
+    top n films by the sum of `by` (cur_sales or cur_tickets) of bulletins within start and end (yyyy-mm-dd)
+    return rows of name, pubDate, total, bulletins (number of bulletins listing the film)
+    only lines of the period are read, through the period index (see TOP_N_SQL and its plan by EXPLAIN QUERY PLAN)
+    """
+    if by not in RANKING_VALUES:
+        raise ValueError('by must be one of {}'.format(RANKING_VALUES))
+    return con.execute(TOP_N_SQL.format(by), (start, end, end, n)).fetchall()
+
+def bulletin(con, fileName):
+    """every line of bulletin fileName, in order of page and line"""
+    return con.execute('SELECT * FROM hist WHERE fileName=? ORDER BY pageNum, lineIdx', (fileName,)).fetchall()
+
+#%%
+if __name__=='__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hist', default=HIST_PATH, help='history file written by box.py')
+    parser.add_argument('--db', default=DB_PATH)
+    subparsers=parser.add_subparsers(dest='query')
+    film=subparsers.add_parser('film', help='every line of a film')
+    film.add_argument('name', type=lambda x: x.decode('utf8'))
+    film.add_argument('--pub-date')
+    top=subparsers.add_parser('top', help='top films of a period')
+    top.add_argument('start')
+    top.add_argument('end')
+    top.add_argument('-n', type=int, default=10)
+    top.add_argument('--by', choices=RANKING_VALUES, default='cur_sales')
+    bulletin_parser=subparsers.add_parser('bulletin', help='every line of a bulletin')
+    bulletin_parser.add_argument('fileName')
+    args=parser.parse_args()
+
+    con=connect(args.hist, args.db)
+    if args.query=='film':
+        rows=film_series(con, args.name, args.pub_date)
+    elif args.query=='top':
+        rows=top_n(con, args.start, args.end, args.n, args.by)
+    else:
+        rows=bulletin(con, args.fileName)
+    if rows:
+        print '\t'.join(rows[0].keys())
+    for row in rows:
+        print u'\t'.join(u'NULL' if x is None else unicode(x) for x in row).encode('utf8')